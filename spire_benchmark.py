@@ -0,0 +1,319 @@
+#! /usr/bin/env python3
+
+import sys
+import os
+import argparse
+import csv
+import json
+import time
+import random
+import re
+import inspect
+import tempfile
+import concurrent.futures
+import multiprocessing
+import subprocess
+import statistics
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import spire_mapper
+
+#--rows in the file the profiling comments in the mapper were taken from
+profiled_row_count = 92854
+
+#----------------------------------------
+def load_column_profiles():
+    ''' parses the columnName profiling comments in the mapper into value distributions '''
+    source = inspect.getsource(spire_mapper.mapper.load_reference_data)
+    column_profiles = []
+    for match in re.finditer(r'# columnName: (\w+)\n\s*# ([\d.]+) populated, ([\d.]+) unique\n((?:\s*#\s{2,}.*\(\d+\)\n)+)', source):
+        top_values = []
+        for value_line in match.group(4).strip().split('\n'):
+            value_match = re.match(r'\s*#\s+(.*) \((\d+)\)$', value_line)
+            top_values.append((value_match.group(1), int(value_match.group(2))))
+        column_profiles.append({'column': match.group(1),
+                                'populated_pct': float(match.group(2)),
+                                'unique_pct': float(match.group(3)),
+                                'top_values': top_values})
+    return column_profiles
+
+#=========================
+class column_generator(): # pylint: disable=too-many-instance-attributes
+    ''' generates values for one column following its profiled distribution '''
+
+    #----------------------------------------
+    def __init__(self, profile, row_count, rng):
+        self.rng = rng
+        self.column = profile['column']
+        self.top_values = [value for value, count in profile['top_values']]
+        self.top_weights = [count for value, count in profile['top_values']]
+
+        populated_rows = max(1, int(profiled_row_count * profile['populated_pct'] / 100))
+        self.populated_pct = profile['populated_pct'] / 100
+        self.top_share = min(1.0, sum(self.top_weights) / populated_rows)
+
+        #--nearly unique columns like imo get a value per row, the rest draw from a pool sized by their cardinality
+        self.sequential = profile['unique_pct'] >= 95
+        self.sequence = 0
+        self.pool_size = max(1, int(row_count * self.populated_pct * profile['unique_pct'] / 100))
+
+        if all(re.match(r'^\d{4}-\d{2}-\d{2} 00:00:00 UTC$', value) for value in self.top_values):
+            self.value_kind = 'date'
+        elif all(re.match(r'^-?\d+(\.\d+)?$', value) for value in self.top_values):
+            self.value_kind = 'decimal' if any('.' in value for value in self.top_values) else 'integer'
+            numbers = [float(value) for value in self.top_values]
+            self.low = min(numbers) * 0.5
+            self.high = max(numbers) * 1.5 + 1
+        else:
+            self.value_kind = 'text'
+
+    #----------------------------------------
+    def pool_value(self, index):
+        if self.value_kind == 'date':
+            return time.strftime('%Y-%m-%d 00:00:00 UTC', time.gmtime(315532800 + (index % 25000) * 86400))
+        if self.value_kind in ('integer', 'decimal'):
+            number = self.low + (index * 7919 % 100000) / 100000 * (self.high - self.low)
+            return str(int(number)) if self.value_kind == 'integer' else str(round(number, 2))
+        return '%s %s' % (self.top_values[index % len(self.top_values)], index)
+
+    #----------------------------------------
+    def generate(self, batch_size):
+        choices = self.rng.choices(['', 'TOP', 'POOL'],
+                                   weights=[1 - self.populated_pct, self.populated_pct * self.top_share, self.populated_pct * (1 - self.top_share)],
+                                   k=batch_size)
+        top_choices = iter(self.rng.choices(self.top_values, weights=self.top_weights, k=batch_size))
+        values = []
+        for choice in choices:
+            if choice == 'TOP':
+                values.append(next(top_choices))
+            elif choice == 'POOL':
+                if self.sequential:
+                    self.sequence += 1
+                    index = self.sequence
+                else:
+                    index = self.rng.randrange(self.pool_size)
+                values.append(self.pool_value(index))
+            else:
+                values.append('')
+        return values
+
+#----------------------------------------
+def generate_spire_file(file_name, row_count, seed = None, batch_size = 10000):
+    ''' writes a synthetic spire vessel csv following the mapper's profiling comments '''
+    rng = random.Random(seed)
+    column_profiles = load_column_profiles()
+    generators = [column_generator(profile, row_count, rng) for profile in column_profiles]
+
+    with open(file_name, 'w', encoding='utf-8', newline='') as output_file:
+        writer = csv.writer(output_file)
+        writer.writerow([profile['column'] for profile in column_profiles])
+        rows_written = 0
+        while rows_written < row_count:
+            this_batch = min(batch_size, row_count - rows_written)
+            columns = [generator.generate(this_batch) for generator in generators]
+
+            #--every vessel needs a unique imo as its record_id
+            columns[0] = [str(9000000 + rows_written + i) for i in range(this_batch)]
+            writer.writerows(zip(*columns))
+            rows_written += this_batch
+
+#----------------------------------------
+def get_peak_rss_mb():
+    if not resource:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #--linux reports kilobytes, macos bytes
+    return round(peak_rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+#----------------------------------------
+def run_mapping_benchmark(csv_file_name, fast_csv = False, json_library = 'auto'):
+    ''' maps the file once and returns throughput and the time spent in each stage '''
+    mapper = spire_mapper.mapper()
+    serialize = spire_mapper.get_json_serializer(json_library)
+    stage_times = {'parse': 0.0, 'map': 0.0, 'stats': 0.0, 'serialize': 0.0, 'write': 0.0}
+
+    #--time stats capture separately from the rest of map()
+    capture_mapped_stats = mapper.capture_mapped_stats
+    def timed_capture_mapped_stats(json_data):
+        start_time = time.perf_counter()
+        capture_mapped_stats(json_data)
+        stage_times['stats'] += time.perf_counter() - start_time
+    mapper.capture_mapped_stats = timed_capture_mapped_stats
+
+    input_row_count = 0
+    output_row_count = 0
+    proc_start_time = time.perf_counter()
+    with open(csv_file_name, 'r', encoding='utf-8', newline='') as input_file, tempfile.TemporaryFile('w', encoding='utf-8') as output_file:
+        if fast_csv:
+            input_rows = csv.reader(input_file)
+            mapper.set_header(next(input_rows))
+            map_function = mapper.map_row
+        else:
+            input_rows = csv.DictReader(input_file)
+            map_function = mapper.map
+
+        output_batch = []
+        while True:
+            time1 = time.perf_counter()
+            input_row = next(input_rows, None)
+            time2 = time.perf_counter()
+            stage_times['parse'] += time2 - time1
+            if input_row is None:
+                break
+            input_row_count += 1
+
+            json_list = map_function(input_row, input_row_count)
+            time3 = time.perf_counter()
+            stage_times['map'] += time3 - time2
+
+            for json_data in json_list:
+                output_batch.append(serialize(json_data))
+            output_row_count += len(json_list)
+            time4 = time.perf_counter()
+            stage_times['serialize'] += time4 - time3
+
+            if len(output_batch) >= 1000:
+                output_batch.append('')
+                output_file.write('\n'.join(output_batch))
+                output_batch = []
+                stage_times['write'] += time.perf_counter() - time4
+
+        output_batch.append('')
+        output_file.write('\n'.join(output_batch))
+
+    #--stats are counted a batch of records at a time, count the last partial batch
+    time1 = time.perf_counter()
+    mapper.stat_pack.flush()
+    stage_times['stats'] += time.perf_counter() - time1
+
+    elapsed_seconds = time.perf_counter() - proc_start_time
+    stage_times['map'] -= stage_times['stats']
+    input_mb = os.path.getsize(csv_file_name) / (1024 * 1024)
+    return {'input_rows': input_row_count,
+            'output_rows': output_row_count,
+            'seconds': round(elapsed_seconds, 2),
+            'rows_per_sec': round(input_row_count / elapsed_seconds),
+            'mb_per_sec': round(input_mb / elapsed_seconds, 2),
+            'peak_rss_mb': get_peak_rss_mb(),
+            'stage_pct': {stage: round(stage_time / elapsed_seconds * 100, 1) for stage, stage_time in stage_times.items()}}
+
+#----------------------------------------
+def run_hash_benchmark(csv_file_name):
+    ''' times each record id hash over every owner value in the file, hashed per row and through the owner index '''
+    mapper = spire_mapper.mapper()
+    owner_columns = list(mapper.owner_roles)
+    with open(csv_file_name, 'r', encoding='utf-8', newline='') as input_file:
+        owner_names = [row[column] for row in csv.DictReader(input_file) for column in owner_columns if row[column]]
+
+    results = {}
+    schemes = [('compute_record_hash', mapper.compute_record_hash)]
+    for record_id_hash in ('md5', 'blake2b', 'xxhash'):
+        try:
+            schemes.append((record_id_hash, spire_mapper.get_record_id_hasher(record_id_hash)))
+        except ValueError as err:
+            results[record_id_hash] = {'skipped': str(err)}
+
+    for scheme, compute_owner_id in schemes:
+        start_time = time.perf_counter()
+        for owner_name in owner_names:
+            compute_owner_id(owner_name)
+        per_row_seconds = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        owner_index = {}
+        for owner_name in owner_names:
+            record_id = owner_index.get(owner_name)
+            if record_id is None:
+                record_id = owner_index[owner_name] = compute_owner_id(owner_name)
+        indexed_seconds = time.perf_counter() - start_time
+
+        results[scheme] = {'owner_values': len(owner_names),
+                           'distinct_owners': len(owner_index),
+                           'per_row_seconds': round(per_row_seconds, 3),
+                           'ids_per_sec': round(len(owner_names) / per_row_seconds),
+                           'indexed_seconds': round(indexed_seconds, 3)}
+    return results
+
+#----------------------------------------
+def run_startup_benchmark(runs = 10):
+    ''' times fresh interpreters importing the mapper and printing its help, against a bare interpreter '''
+    mapper_dir = os.path.dirname(os.path.abspath(spire_mapper.__file__))
+    commands = {'interpreter': [sys.executable, '-c', 'pass'],
+                'import': [sys.executable, '-c', 'import spire_mapper'],
+                'help': [sys.executable, os.path.join(mapper_dir, 'spire_mapper.py'), '--help']}
+    results = {}
+    for name, command in commands.items():
+        run_seconds = []
+        for _ in range(runs):
+            start_time = time.perf_counter()
+            subprocess.run(command, cwd=mapper_dir, stdout=subprocess.DEVNULL, check=True)
+            run_seconds.append(time.perf_counter() - start_time)
+        results[name] = {'min_ms': round(min(run_seconds) * 1000, 1),
+                         'median_ms': round(statistics.median(run_seconds) * 1000, 1)}
+    return results
+
+#----------------------------------------
+def run_isolated(function, *args):
+    ''' runs a benchmark in a fresh interpreter so peak rss is its own '''
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(function, *args).result()
+
+#----------------------------------------
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-r', '--rows', dest='rows', type=int, nargs='+', default=[100000], help='synthetic file sizes to benchmark, defaults to 100000')
+    parser.add_argument('-s', '--seed', dest='seed', type=int, default=1, help='random seed for the synthetic data, defaults to 1')
+    parser.add_argument('-d', '--data_dir', dest='data_dir', default=tempfile.gettempdir(), help='directory for the synthetic files, existing ones are reused')
+    parser.add_argument('-g', '--generate_only', dest='generate_only', action='store_true', default=False, help='only write the synthetic files')
+    parser.add_argument('--fast_csv', dest='fast_csv', action='store_true', default=False, help='benchmark the csv.reader ingestion path')
+    parser.add_argument('--json_library', dest='json_library', choices=['auto', 'orjson', 'ujson', 'json'], default='auto', help='json library to benchmark, defaults to auto')
+    parser.add_argument('--hash_benchmark', dest='hash_benchmark', action='store_true', default=False, help='also time the owner record id hashes')
+    parser.add_argument('--startup_benchmark', dest='startup_benchmark', action='store_true', default=False, help='also time importing the mapper and starting the command line')
+    parser.add_argument('-o', '--output_file', dest='output_file', help='optional json file for the results, useful to compare runs for regressions')
+    args = parser.parse_args()
+
+    results = []
+    if args.startup_benchmark:
+        print('starting the mapper ...')
+        startup_result = run_startup_benchmark()
+        results.append({'startup': startup_result})
+        for name, run_result in startup_result.items():
+            print('  %s %s ms median, %s ms min' % (name, run_result['median_ms'], run_result['min_ms']))
+
+    for row_count in args.rows:
+        csv_file_name = os.path.join(args.data_dir, 'synthetic_spire_%s_%s.csv' % (row_count, args.seed))
+        if not os.path.exists(csv_file_name):
+            print('generating %s rows to %s ...' % (row_count, csv_file_name))
+            generate_start_time = time.time()
+            generate_spire_file(csv_file_name, row_count, args.seed)
+            print('  generated in %s seconds' % round(time.time() - generate_start_time, 1))
+        if args.generate_only:
+            continue
+
+        print('mapping %s rows ...' % row_count)
+        result = run_isolated(run_mapping_benchmark, csv_file_name, args.fast_csv, args.json_library)
+        result['file'] = csv_file_name
+        results.append(result)
+        print('  %(rows_per_sec)s rows/sec, %(mb_per_sec)s MB/sec, %(peak_rss_mb)s MB peak rss, %(output_rows)s records written in %(seconds)s seconds' % result)
+        print('  ' + ', '.join('%s %s%%' % (stage, pct) for stage, pct in result['stage_pct'].items()))
+
+        if args.hash_benchmark:
+            print('hashing owner record ids ...')
+            result['record_id_hash'] = run_isolated(run_hash_benchmark, csv_file_name)
+            for scheme, hash_result in result['record_id_hash'].items():
+                if 'skipped' in hash_result:
+                    print('  %s skipped, %s' % (scheme, hash_result['skipped']))
+                else:
+                    print('  %s %s ids/sec, %s seconds per row, %s seconds through the owner index' % (scheme, hash_result['ids_per_sec'], hash_result['per_row_seconds'], hash_result['indexed_seconds']))
+
+    if args.output_file and results:
+        with open(args.output_file, 'w') as outfile:
+            json.dump(results, outfile, indent=4)
+        print('Benchmark results written to %s' % args.output_file)
+
+    sys.exit(0)
@@ -0,0 +1,251 @@
+#! /usr/bin/env python3
+
+import sys
+import os
+import argparse
+import csv
+import mmap
+import struct
+import time
+
+import spire_mapper
+
+#=========================
+class vessel_index(): # pylint: disable=too-many-instance-attributes
+    ''' sorted on disk imo and mmsi -> byte offset index over an uncompressed spire csv, read through mmap '''
+
+    #--the index file starts with the size and modification time of the csv it was built from
+    header_format = '8sQQ'
+    header_size = struct.calcsize(header_format)
+    magic = b'SPIREIDX'
+
+    #--fixed width entries: key type, imo or mmsi value, byte offset of the row in the csv
+    entry_format = '1s20sQ'
+    entry_size = struct.calcsize(entry_format)
+    key_columns = {'imo': b'I', 'mmsi': b'M'}
+
+    #----------------------------------------
+    def __init__(self, csv_file_name, index_file_name = None):
+        self.csv_file_name = csv_file_name
+        self.index_file_name = index_file_name or csv_file_name + '.idx'
+        self.clean_value = spire_mapper.mapper().clean_value
+        self.csv_file_handle = None
+        self.csv_map = None
+        self.index_file_handle = None
+        self.index_map = None
+        self.entry_count = 0
+        self.header = None
+
+    #----------------------------------------
+    def csv_signature(self):
+        csv_stat = os.stat(self.csv_file_name)
+        return struct.pack(self.header_format, self.magic, csv_stat.st_size, csv_stat.st_mtime_ns)
+
+    #----------------------------------------
+    def is_current(self):
+        ''' the index is only used if it was built from the csv as it is now '''
+        if not os.path.exists(self.index_file_name):
+            return False
+        with open(self.index_file_name, 'rb') as index_file:
+            return index_file.read(self.header_size) == self.csv_signature()
+
+    #----------------------------------------
+    def make_entry(self, key_type, key_value, offset):
+        return struct.pack(self.entry_format, key_type, key_value.encode('utf-8'), offset)
+
+    #----------------------------------------
+    def build(self):
+        ''' reads the csv once, recording where each row starts, and writes the sorted entries '''
+        with open(self.csv_file_name, 'rb') as binary_handle:
+            if spire_mapper.get_compression(self.csv_file_name, binary_handle):
+                raise ValueError('%s is compressed, the index needs an uncompressed csv to memory map' % self.csv_file_name)
+            input_reader = spire_mapper.offset_line_reader(binary_handle)
+            csv_reader = csv.reader(iter(input_reader), dialect='excel')
+            column_indexes = {column: i for i, column in enumerate(next(csv_reader, []))}
+            for column in self.key_columns:
+                if column not in column_indexes:
+                    raise ValueError('column %s not found in the csv header' % column)
+
+            #--csv.reader does not read ahead, so the offset after a row is where the next one starts
+            entries = []
+            skipped_count = 0
+            row_offset = input_reader.offset
+            for row in csv_reader:
+                for column, key_type in self.key_columns.items():
+                    key_value = self.clean_value(row[column_indexes[column]]) if column_indexes[column] < len(row) else ''
+                    if not key_value:
+                        continue
+                    if len(key_value.encode('utf-8')) > 20:
+                        skipped_count += 1
+                        continue
+                    entries.append(self.make_entry(key_type, key_value, row_offset))
+                row_offset = input_reader.offset
+
+        entries.sort()
+        temp_file_name = self.index_file_name + '.tmp'
+        with open(temp_file_name, 'wb') as index_file:
+            index_file.write(self.csv_signature())
+            index_file.write(b''.join(entries))
+        os.replace(temp_file_name, self.index_file_name)
+        return len(entries), skipped_count
+
+    #----------------------------------------
+    def open(self):
+        self.index_file_handle = open(self.index_file_name, 'rb')
+        index_size = os.fstat(self.index_file_handle.fileno()).st_size
+        if index_size < self.header_size or (index_size - self.header_size) % self.entry_size:
+            raise ValueError('%s is not a valid index file' % self.index_file_name)
+        self.entry_count = (index_size - self.header_size) // self.entry_size
+        if self.entry_count:
+            self.index_map = mmap.mmap(self.index_file_handle.fileno(), 0, access=mmap.ACCESS_READ)
+        self.csv_file_handle = open(self.csv_file_name, 'rb')
+        if os.fstat(self.csv_file_handle.fileno()).st_size:
+            self.csv_map = mmap.mmap(self.csv_file_handle.fileno(), 0, access=mmap.ACCESS_READ)
+            self.header = self.read_row(0)
+
+    #----------------------------------------
+    def find(self, column, key_value):
+        ''' binary search of the memory mapped index, returns the offsets of every row with this imo or mmsi '''
+        key_value = self.clean_value(key_value)
+        if not key_value or not self.index_map:
+            return []
+        entry_key = self.make_entry(self.key_columns[column], key_value, 0)[:21]
+        low = 0
+        high = self.entry_count
+        while low < high:
+            mid = (low + high) // 2
+            offset = self.header_size + mid * self.entry_size
+            if self.index_map[offset: offset + 21] < entry_key:
+                low = mid + 1
+            else:
+                high = mid
+        row_offsets = []
+        offset = self.header_size + low * self.entry_size
+        while low < self.entry_count and self.index_map[offset: offset + 21] == entry_key:
+            row_offsets.append(struct.unpack(self.entry_format, self.index_map[offset: offset + self.entry_size])[2])
+            low += 1
+            offset += self.entry_size
+        return row_offsets
+
+    #----------------------------------------
+    def read_lines(self, offset):
+        while offset < len(self.csv_map):
+            line_end = self.csv_map.find(b'\n', offset)
+            line_end = len(self.csv_map) if line_end == -1 else line_end + 1
+            yield self.csv_map[offset: line_end].decode('utf-8')
+            offset = line_end
+
+    #----------------------------------------
+    def read_row(self, offset):
+        ''' parses the csv row starting at offset, quoted values may span lines '''
+        return next(csv.reader(self.read_lines(offset), dialect='excel'), [])
+
+    #----------------------------------------
+    def close(self):
+        for file_map in (self.index_map, self.csv_map):
+            if file_map:
+                file_map.close()
+        for file_handle in (self.index_file_handle, self.csv_file_handle):
+            if file_handle:
+                file_handle.close()
+
+#----------------------------------------
+def map_vessels(index, mapper, imos = (), mmsis = ()):
+    ''' maps just the rows for these vessels, returns the records and the ids that were not found '''
+    mapper.set_header(index.header)
+    json_list = []
+    missing_ids = []
+    mapped_offsets = set()
+    for column, key_values in (('imo', imos), ('mmsi', mmsis)):
+        for key_value in key_values:
+            row_offsets = index.find(column, key_value)
+            if not row_offsets:
+                missing_ids.append('%s %s' % (column, key_value))
+            for row_offset in row_offsets:
+                #--a vessel asked for by both its imo and mmsi is only mapped once
+                if row_offset in mapped_offsets:
+                    continue
+                mapped_offsets.add(row_offset)
+                json_list.extend(mapper.map_row(index.read_row(row_offset)))
+    return json_list, missing_ids
+
+#----------------------------------------
+def read_id_file(file_name):
+    with open(file_name, 'r') as id_file:
+        return [line.strip() for line in id_file if line.strip()]
+
+#----------------------------------------
+if __name__ == "__main__":
+    proc_start_time = time.time()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--input_file', dest='input_file', required=True, help='the uncompressed spire csv file to index')
+    parser.add_argument('-x', '--index_file', dest='index_file', help='the index file, defaults to the input file name plus .idx')
+    parser.add_argument('--rebuild', dest='rebuild', action='store_true', default=False, help='rebuild the index even if it is current, it is rebuilt anyway when the csv changes')
+    parser.add_argument('--imo', dest='imo', nargs='+', default=[], help='imo numbers of the vessels to map')
+    parser.add_argument('--mmsi', dest='mmsi', nargs='+', default=[], help='mmsi numbers of the vessels to map')
+    parser.add_argument('--imo_file', dest='imo_file', help='a file of imo numbers to map, one per line')
+    parser.add_argument('--mmsi_file', dest='mmsi_file', help='a file of mmsi numbers to map, one per line')
+    parser.add_argument('-o', '--output_file', dest='output_file', default='-', help='the json file for the mapped vessels, compressed by extension, defaults to - for stdout')
+    parser.add_argument('-m', '--mapping_file', dest='mapping_file', help='optional json file of column mappings, the same as for spire_mapper.py')
+    parser.add_argument('--record_id_hash', dest='record_id_hash', choices=['md5', 'blake2b', 'xxhash'], default='md5', help='hash used for the owner record_ids, use the same as the full run')
+    parser.add_argument('--typed_values', dest='typed_values', action='store_true', default=False, help='write numeric and boolean columns as numbers and booleans, use it if the full run did')
+    parser.add_argument('--columns', dest='columns', nargs='+', help='only map these columns, use the same as the full run')
+    parser.add_argument('--no_payload', dest='no_payload', action='store_true', default=False, help='skip the payload columns, use it if the full run did')
+    parser.add_argument('--all_owner_records', dest='all_owner_records', action='store_true', default=False, help='write an owner record for every vessel, use it if the full run did')
+    parser.add_argument('--json_library', dest='json_library', choices=['auto', 'orjson', 'ujson', 'json'], default='auto', help='json library used to write the output, auto uses orjson or ujson when installed')
+    args = parser.parse_args()
+
+    try:
+        spire_mapper.get_record_id_hasher(args.record_id_hash)
+    except ValueError as err:
+        print('\n%s\n' % err)
+        sys.exit(1)
+    if not os.path.exists(args.input_file):
+        print('\nInput file %s not found\n' % args.input_file)
+        sys.exit(1)
+    if args.mapping_file and not os.path.exists(args.mapping_file):
+        print('\nMapping file %s not found\n' % args.mapping_file)
+        sys.exit(1)
+
+    #--keep progress messages out of the records when writing to stdout
+    if args.output_file == '-':
+        sys.stdout = sys.stderr
+
+    index = vessel_index(args.input_file, args.index_file)
+    try:
+        if args.rebuild or not index.is_current():
+            print('Indexing %s ...' % args.input_file)
+            entry_count, skipped_count = index.build()
+            print('%s entries written to %s%s\n' % (entry_count, index.index_file_name, (', %s values too long to index' % skipped_count) if skipped_count else ''))
+        index.open()
+        imos = args.imo + (read_id_file(args.imo_file) if args.imo_file else [])
+        mmsis = args.mmsi + (read_id_file(args.mmsi_file) if args.mmsi_file else [])
+        if imos or mmsis:
+            #--the same mapping options as the full run so the records and owner ids match it
+            mapper = spire_mapper.mapper(dedupe_owners=not args.all_owner_records,
+                                         mapping_file=args.mapping_file,
+                                         record_id_hash=args.record_id_hash,
+                                         columns=args.columns,
+                                         payload=not args.no_payload,
+                                         typed_values=args.typed_values)
+            json_list, missing_ids = map_vessels(index, mapper, imos, mmsis)
+            output_file_handle, output_binary_handle = spire_mapper.open_output_file(args.output_file)
+            output_writer = spire_mapper.record_writer(output_file_handle, args.json_library)
+            for json_data in json_list:
+                output_writer.write(json_data)
+            output_writer.close()
+            spire_mapper.close_file(output_file_handle, output_binary_handle)
+            print('%s records written for %s vessels requested' % (len(json_list), len(imos) + len(mmsis)))
+            if missing_ids:
+                print('%s not found: %s' % (len(missing_ids), ', '.join(missing_ids[:10]) + (' ...' if len(missing_ids) > 10 else '')))
+            print()
+    except ValueError as err:
+        print('\n%s\n' % err)
+        sys.exit(1)
+    finally:
+        index.close()
+
+    elapsed_secs = round(time.time() - proc_start_time, 1)
+    print('Completed in %s seconds\n' % elapsed_secs)
+    sys.exit(0)
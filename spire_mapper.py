@@ -1,35 +1,584 @@
 #! /usr/bin/env python3
+# pylint: disable=too-many-lines
 
 import sys
 import os
-import argparse
 import csv
 import json
 import time
-from datetime import datetime
-from dateutil.parser import parse as dateparse
+from datetime import datetime, date
 import signal
 import random
 import hashlib
+import operator
+import itertools
+import functools
+import collections
+import io
+import mmap
+import heapq
+import struct
+import abc
+import math
+import zlib
+
+compression_extensions = {'.gz': 'gzip', '.gzip': 'gzip', '.bz2': 'bz2', '.xz': 'xz', '.zst': 'zstd', '.zstd': 'zstd'}
+input_format_extensions = {'.parquet': 'parquet', '.pq': 'parquet', '.arrow': 'arrow', '.feather': 'arrow', '.ipc': 'arrow'}
+compression_magic = [(b'\x1f\x8b', 'gzip'), (b'BZh', 'bz2'), (b'\xfd7zXZ\x00', 'xz'), (b'\x28\xb5\x2f\xfd', 'zstd')]
+
+#--set by the interrupt handler of the command line, a library caller can set it to stop map_parallel early
+shut_down = False
+
+#--modules only some runs need, like dateutil, the compression and json libraries or threading, are imported where
+#--they are used so importing the mapper as a library or starting a small run does not pay for them
 
 #=========================
-class mapper():
+class attribute_stats(): # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    ''' counters for a single mapped attribute '''
+    __slots__ = ('count', 'repeat_count', 'values', 'unique_count', 'unique_capped', 'examples', 'examples_offered', 'sketch')
+
+    #----------------------------------------
+    def __init__(self, bounded = False):
+        self.count = 0
+        self.repeat_count = 0
+        self.values = set()
+        self.unique_count = 0
+        self.unique_capped = False
+        self.examples = []
+        self.examples_offered = 0
+        self.sketch = value_sketch() if bounded else None
+
+#=========================
+class value_sketch(): # pylint: disable=too-many-instance-attributes
+    ''' distinct count, most frequent values and examples of an attribute in a fixed amount of memory '''
+    __slots__ = ('counts', 'errors', 'buckets', 'min_count', 'registers', 'examples', 'max_counts', 'max_examples')
+
+    #--hyperloglog registers, 2**12 of them give about a 1.6% error on the distinct count, plenty for a 32 bit hash
+    precision = 12
+    rank_bits = 32 - precision
+    rank_mask = (1 << rank_bits) - 1
+
+    #----------------------------------------
+    def __init__(self, max_counts = 2000, max_examples = 5):
+        self.counts = {}
+        self.errors = {}
+        self.buckets = {}
+        self.min_count = 0
+        self.registers = None
+        self.examples = {}
+        self.max_counts = max_counts
+        self.max_examples = max_examples
+
+    #----------------------------------------
+    @staticmethod
+    def hash_value(value):
+        #--crc32 is stable across worker processes unlike hash(), the murmur3 finalizer spreads its bits for similar values
+        hash_value = zlib.crc32(str(value).encode('utf-8'))
+        hash_value = ((hash_value ^ (hash_value >> 16)) * 0x85ebca6b) & 0xffffffff
+        hash_value = ((hash_value ^ (hash_value >> 13)) * 0xc2b2ae35) & 0xffffffff
+        return hash_value ^ (hash_value >> 16)
+
+    #----------------------------------------
+    def add(self, value, weight = 1):
+        ''' space saving update, a value that does not fit takes the place of one of the least counted values and their count '''
+        counts = self.counts
+        buckets = self.buckets
+        count = counts.get(value)
+        if count is not None:
+            bucket = buckets[count]
+            bucket.discard(value)
+            if not bucket:
+                del buckets[count]
+        else:
+            #--values already counted have been hashed, so only the ones new to the table can change the registers or the examples
+            hash_value = self.hash_value(value)
+            self.add_example(value, hash_value)
+            if self.registers is not None:
+                self.add_register(hash_value)
+            count = 0
+            if len(counts) >= self.max_counts:
+                count = self.errors[value] = self.evict()
+        count += weight
+        counts[value] = count
+        bucket = buckets.get(count)
+        if bucket is None:
+            buckets[count] = {value}
+        else:
+            bucket.add(value)
+
+    #----------------------------------------
+    def evict(self):
+        ''' drops one of the least counted values, switching to the hyperloglog count the first time '''
+        if self.registers is None:
+            self.registers = bytearray(1 << self.precision)
+            for value in self.counts:
+                self.add_register(self.hash_value(value))
+            self.min_count = min(self.buckets)
+
+        #--the smallest count never goes down once the table is full, so walking up to it is amortized over the updates
+        while self.min_count not in self.buckets:
+            self.min_count += 1
+        bucket = self.buckets[self.min_count]
+        value = bucket.pop()
+        if not bucket:
+            del self.buckets[self.min_count]
+        del self.counts[value]
+        self.errors.pop(value, None)
+        return self.min_count
+
+    #----------------------------------------
+    def add_register(self, hash_value):
+        index = hash_value >> self.rank_bits
+        rank = self.rank_bits + 1 - (hash_value & self.rank_mask).bit_length()
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    #----------------------------------------
+    def add_example(self, value, hash_value):
+        ''' keeps the values with the smallest hashes, a sample that does not depend on the order or the number of times they are seen '''
+        examples = self.examples
+        if hash_value in examples:
+            return
+        if len(examples) < self.max_examples:
+            examples[hash_value] = value
+            return
+        largest_hash = max(examples)
+        if hash_value < largest_hash:
+            del examples[largest_hash]
+            examples[hash_value] = value
+
+    #----------------------------------------
+    def merge(self, other):
+        if self.registers is not None or other.registers is not None or len(self.counts.keys() | other.counts.keys()) > self.max_counts:
+            for sketch in (self, other):
+                if sketch.registers is None:
+                    sketch.registers = bytearray(1 << self.precision)
+                    for value in sketch.counts:
+                        sketch.add_register(sketch.hash_value(value))
+            self.registers = bytearray(map(max, self.registers, other.registers))
+
+        counts = collections.Counter(self.counts)
+        counts.update(other.counts)
+        self.counts = dict(counts.most_common(self.max_counts))
+        errors = collections.Counter(self.errors)
+        errors.update(other.errors)
+        self.errors = {value: error for value, error in errors.items() if value in self.counts}
+        self.buckets = {}
+        for value, count in self.counts.items():
+            self.buckets.setdefault(count, set()).add(value)
+        self.min_count = min(self.buckets) if self.buckets else 0
+
+        self.examples.update(other.examples)
+        for hash_value in sorted(self.examples)[self.max_examples:]:
+            del self.examples[hash_value]
+
+    #----------------------------------------
+    def distinct_count(self):
+        if self.registers is None:
+            return len(self.counts)
+        register_count = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / register_count)
+        estimate = alpha * register_count * register_count / sum(2.0 ** -rank for rank in self.registers)
+        zero_count = self.registers.count(0)
+        if estimate <= 2.5 * register_count and zero_count:
+            estimate = register_count * math.log(register_count / zero_count)
+        return round(estimate)
+
+    #----------------------------------------
+    def top_values(self, top_count = 5):
+        ''' [value, count] pairs, once values have been dropped a count can be overstated by the count it took over '''
+        #--only values seen more often than the least counted one, less the count they took over, are sure to be frequent
+        min_count = min(self.buckets) if self.registers is not None and self.buckets else 0
+        frequent_values = ((value, count) for value, count in self.counts.items() if count - self.errors.get(value, 0) > min_count)
+        return [[value, count] for value, count in heapq.nlargest(top_count, frequent_values, key=operator.itemgetter(1))]
+
+    #----------------------------------------
+    def example_values(self):
+        return [self.examples[hash_value] for hash_value in sorted(self.examples)]
+
+#=========================
+class mapping_stats(): # pylint: disable=too-many-instance-attributes
+    ''' collects the attribute statistics for the log file '''
+    __slots__ = ('attributes', 'record_counts', 'record_batches', 'batch_size', 'max_examples', 'max_unique', 'rng', 'bounded')
+
+    #----------------------------------------
+    def __init__(self, seed = None, max_examples = 5, max_unique = 1000000, batch_size = 1000, *, bounded = False): # pylint: disable=too-many-arguments
+        self.attributes = {}
+        self.record_counts = {}
+        self.record_batches = {}
+        self.batch_size = batch_size
+        self.max_examples = max_examples
+        self.max_unique = max_unique
+        self.rng = random.Random(seed)
+
+        #--bounded stats keep a value_sketch per attribute instead of a set of every distinct value
+        self.bounded = bounded
+
+    #----------------------------------------
+    def __getstate__(self):
+        #--pickled to pass the stats between processes, count any buffered records first
+        self.flush()
+        return None, {name: getattr(self, name) for name in self.__slots__}
+
+    #----------------------------------------
+    def add_record(self, cat1, json_data):
+        ''' buffers a mapped record, its attributes are counted a batch at a time '''
+        record_batch = self.record_batches.get(cat1)
+        if record_batch is None:
+            record_batch = self.record_batches[cat1] = []
+        record_batch.append(json_data)
+        if len(record_batch) >= self.batch_size:
+            self.update_records(cat1, record_batch)
+            self.record_batches[cat1] = []
+
+    #----------------------------------------
+    def update_records(self, cat1, records):
+        ''' counts a batch of records an attribute at a time '''
+        self.record_counts[cat1] = self.record_counts.get(cat1, 0) + len(records)
+        self.update_columns(cat1, records)
+
+    #----------------------------------------
+    def update_columns(self, cat1, records):
+        for cat2 in dict.fromkeys(itertools.chain.from_iterable(records)):
+            column = list(map(dict.get, records, itertools.repeat(cat2, len(records))))
+
+            #--lists hold sub records, their attributes are counted like the record's own
+            if isinstance(next(filter(None, column), None), list):
+                subrecords = [subrecord for value in column if value for subrecord in value]
+                self.update_columns(cat1, subrecords)
+
+                #--a record has one REL_POINTER per relationship, each is counted but the record is only populated once
+                record_keys = collections.Counter(itertools.chain.from_iterable(set().union(*value) for value in column if value))
+                for subrecord_cat2, subrecord_count in collections.Counter(itertools.chain.from_iterable(subrecords)).items():
+                    if subrecord_count > record_keys[subrecord_cat2]:
+                        self.attributes[(cat1, subrecord_cat2)].repeat_count += subrecord_count - record_keys[subrecord_cat2]
+                continue
+
+            stat = self.attributes.get((cat1, cat2))
+            if stat is None:
+                stat = self.attributes[(cat1, cat2)] = attribute_stats(self.bounded)
+            stat.count += len(column) - column.count(None)
+
+            if stat.sketch is not None:
+                value_counts = collections.Counter(column)
+                value_counts.pop(None, None)
+                value_counts.pop('', None)
+                for value, count in value_counts.items():
+                    stat.sketch.add(value, count)
+                continue
+
+            #--only distinct values are offered to the examples reservoir, in the order they were first seen
+            examples = dict.fromkeys(column)
+            examples.pop(None, None)
+            examples.pop('', None)
+            if not stat.unique_capped:
+                examples = list(itertools.filterfalse(stat.values.__contains__, examples))
+                stat.values.update(examples)
+                stat.unique_count += len(examples)
+                if stat.unique_count >= self.max_unique:
+                    stat.values = set()
+                    stat.unique_capped = True
+            else:
+                examples = list(itertools.filterfalse(stat.examples.__contains__, examples))
+            for example in examples:
+                self.offer_example(stat, example)
+
+    #----------------------------------------
+    def flush(self):
+        for cat1, record_batch in self.record_batches.items():
+            if record_batch:
+                self.update_records(cat1, record_batch)
+        self.record_batches = {}
+
+    #----------------------------------------
+    def update(self, cat1, cat2, example = None):
+        stat = self.attributes.get((cat1, cat2))
+        if stat is None:
+            stat = self.attributes[(cat1, cat2)] = attribute_stats(self.bounded)
+        stat.count += 1
+        if example is None or example == '':
+            return
+
+        if stat.sketch is not None:
+            stat.sketch.add(example)
+            return
+
+        #--only distinct values are offered to the examples reservoir
+        if not stat.unique_capped:
+            if example in stat.values:
+                return
+            stat.values.add(example)
+            stat.unique_count += 1
+            if stat.unique_count >= self.max_unique:
+                stat.values = set()
+                stat.unique_capped = True
+        elif example in stat.examples:
+            return
+        self.offer_example(stat, example)
+
+    #----------------------------------------
+    def offer_example(self, stat, example):
+        stat.examples_offered += 1
+        if len(stat.examples) < self.max_examples:
+            stat.examples.append(example)
+        else:
+            i = self.rng.randrange(stat.examples_offered)
+            if i < self.max_examples:
+                stat.examples[i] = example
+
+    #----------------------------------------
+    def add_count(self, cat1, cat2, count):
+        ''' adds to a counter without examples, for totals kept outside the stats '''
+        stat = self.attributes.get((cat1, cat2))
+        if stat is None:
+            stat = self.attributes[(cat1, cat2)] = attribute_stats()
+        stat.count += count
+
+    #----------------------------------------
+    def get_count(self, cat1, cat2):
+        self.flush()
+        stat = self.attributes.get((cat1, cat2))
+        return stat.count if stat else 0
+
+    #----------------------------------------
+    def merge(self, other):
+        self.flush()
+        other.flush()
+        for cat1, record_count in other.record_counts.items():
+            self.record_counts[cat1] = self.record_counts.get(cat1, 0) + record_count
+
+        for key, other_stat in other.attributes.items():
+            stat = self.attributes.get(key)
+            if stat is None:
+                stat = self.attributes[key] = attribute_stats(other_stat.sketch is not None)
+            stat.count += other_stat.count
+            stat.repeat_count += other_stat.repeat_count
+
+            if other_stat.sketch is not None:
+                stat.sketch.merge(other_stat.sketch)
+                continue
+            if stat.unique_capped or other_stat.unique_capped:
+                stat.unique_count = max(stat.unique_count, other_stat.unique_count)
+                stat.values = set()
+                stat.unique_capped = True
+            else:
+                stat.values |= other_stat.values
+                stat.unique_count = len(stat.values)
+                if stat.unique_count >= self.max_unique:
+                    stat.values = set()
+                    stat.unique_capped = True
+
+            #--draw from each reservoir in proportion to the number of values it was offered
+            pool1 = list(stat.examples)
+            pool2 = [x for x in other_stat.examples if x not in pool1]
+            offered1 = stat.examples_offered
+            offered2 = other_stat.examples_offered
+            stat.examples = []
+            while len(stat.examples) < self.max_examples and (pool1 or pool2):
+                if pool2 and (not pool1 or self.rng.randrange(offered1 + offered2) >= offered1):
+                    stat.examples.append(pool2.pop(self.rng.randrange(len(pool2))))
+                    offered2 = max(offered2 - 1, len(pool2))
+                else:
+                    stat.examples.append(pool1.pop(self.rng.randrange(len(pool1))))
+                    offered1 = max(offered1 - 1, len(pool1))
+            stat.examples_offered += other_stat.examples_offered
+
+    #----------------------------------------
+    def report(self):
+        self.flush()
+        stat_pack = {}
+        for (cat1, cat2), stat in self.attributes.items():
+            if cat1 not in stat_pack:
+                stat_pack[cat1] = {}
+            stat_pack[cat1][cat2] = {'count': stat.count}
+            examples = stat.examples if stat.sketch is None else stat.sketch.example_values()
+            if examples:
+                stat_pack[cat1][cat2]['examples'] = examples
+            if self.record_counts.get(cat1) and (stat.examples_offered or stat.sketch is not None and stat.sketch.counts):
+                stat_pack[cat1][cat2]['populated_pct'] = round((stat.count - stat.repeat_count) / self.record_counts[cat1] * 100, 2)
+                if stat.sketch is not None:
+                    unique_count = min(stat.sketch.distinct_count(), stat.count)
+                    stat_pack[cat1][cat2]['unique_pct'] = round(unique_count / stat.count * 100, 2)
+                    stat_pack[cat1][cat2]['top_values'] = stat.sketch.top_values()
+                    if stat.sketch.registers is not None:
+                        stat_pack[cat1][cat2]['unique_approximate'] = True
+                else:
+                    stat_pack[cat1][cat2]['unique_pct'] = round(stat.unique_count / stat.count * 100, 2)
+                    if stat.unique_capped:
+                        stat_pack[cat1][cat2]['unique_capped'] = True
+        return stat_pack
+
+#=========================
+class mapper(): # pylint: disable=too-many-instance-attributes,too-many-public-methods
     ''' standard mapper class '''
 
     #----------------------------------------
-    def __init__(self):
+    def __init__(self, *, dedupe_owners = True, stats_seed = None, mapping_file = None, record_id_hash = 'md5', bounded_stats = False, columns = None, payload = True, typed_values = False): # pylint: disable=too-many-arguments
+
+        self.mapping_file = mapping_file
+        self.columns = columns
+        self.payload = payload
+        self.typed_values = typed_values
+        self.load_reference_data(mapping_file, columns, payload, typed_values)
+        self.stat_pack = mapping_stats(stats_seed, bounded=bounded_stats)
+
+        #--set by set_header for the list rows of the fast csv reader
+        self.row_getters = None
+        self.header_length = 0
+
+        #--owner records are shared by many vessels, only write each one once per run
+        self.dedupe_owners = dedupe_owners
+        self.owner_record_ids = set()
+        self.capture_owner_stats = True
 
-        self.load_reference_data()
-        self.stat_pack = {}
+        #--the attribute stats are only needed for the log file, the command line turns them off without one
+        self.capture_stats = True
+
+        #--owner name: record_id, so each owner name is only hashed once per run, placeholder names map to ''
+        #--md5 ids hash the name as it is in the csv like earlier versions did, the faster hashes use the cleaned name
+        self.record_id_hash = record_id_hash
+        self.compute_owner_id = get_record_id_hasher(record_id_hash)
+        self.owner_ids_from_raw = record_id_hash == 'md5'
+        self.owner_index = {'': ''}
+
+        #--set to a dict by run_metrics to time stats capture
+        self.stage_times = None
 
     #----------------------------------------
     def map(self, raw_data, input_row_num = None):
+        ''' maps a csv.DictReader row '''
+        return self.map_values(raw_data, self.dict_getters, input_row_num)
+
+    #----------------------------------------
+    def map_row(self, row, input_row_num = None):
+        ''' maps a csv.reader row list, set_header must be called first '''
+        if len(row) < self.header_length:
+            row = row + [''] * (self.header_length - len(row))
+        return self.map_values(row, self.row_getters, input_row_num)
+
+    #----------------------------------------
+    def map_rows(self, rows, first_row_num = 1):
+        ''' maps a batch of csv.reader rows, or csv.DictReader rows if no header was set '''
+        map_function = self.map_row if self.row_getters else self.map
+        output_list = []
+        for input_row_num, row in enumerate(rows, first_row_num):
+            output_list.extend(map_function(row, input_row_num))
+        return output_list
+
+    #----------------------------------------
+    def set_header(self, header):
+        ''' resolves the column indexes map_row uses from the csv header '''
+        column_indexes = {column: i for i, column in enumerate(header)}
+        self.check_header(column_indexes)
+        self.header_length = len(header)
+        self.row_getters = self.compile_getters(column_indexes)
+
+    #----------------------------------------
+    def map_batch(self, record_batch, first_row_num = 1):
+        ''' maps a pyarrow record batch a column at a time, giving the same records as mapping its csv rows '''
+        pyarrow = import_pyarrow()
+
+        #--mandatory attributes, the record_id and record type
+        imo_values, imo_indices = self.encode_column(record_batch.column('imo'))
+        imo_cleaner = self.value_cleaners['imo']
+        imo_column = pyarrow.array([imo_cleaner(value) for value in imo_values], pyarrow.string()).take(imo_indices).fill_null('')
+        json_list = [{'DATA_SOURCE': 'SPIRE', 'RECORD_ID': imo, 'RECORD_TYPE': 'VESSEL'} for imo in imo_column.to_pylist()]
+
+        #--column mappings, each distinct value is cleaned and converted once and the empty ones dropped for the whole column
+        #--so every record only gets the attributes it has, in the same order as the csv rows
+        typed_attributes = {attribute: (convert_value, value_type) for attribute, convert_value, value_type in self.typed_attributes}
+        for column_name, attribute in self.column_mappings.items():
+            column_values, column_indices = self.encode_column(record_batch.column(column_name))
+            clean_value = self.value_cleaners[column_name]
+            column_values = [clean_value(value) for value in column_values]
+            value_type = pyarrow.string()
+            if attribute in self.date_attributes:
+                column_values = self.convert_batch_values(column_values, column_indices, self.format_batch_date, 'BAD_DATE')
+            elif attribute in typed_attributes:
+                convert_value, value_type = typed_attributes[attribute]
+                column_values = self.convert_batch_values(column_values, column_indices, convert_value, 'BAD_' + value_type.upper())
+                value_type = {'integer': pyarrow.int64(), 'decimal': pyarrow.float64(), 'boolean': pyarrow.bool_()}[value_type]
+            column = pyarrow.array([None if value == '' else value for value in column_values], value_type).take(column_indices)
+            for json_data, value in zip(itertools.compress(json_list, column.is_valid().to_pylist()), column.drop_null().to_pylist()):
+                json_data[attribute] = value
+
+        #--owner names and record ids are resolved once per distinct value
+        owner_names = []
+        owner_ids = []
+        for column_name in self.owner_roles:
+            column_values, column_indices = self.encode_column(record_batch.column(column_name))
+            clean_value = self.value_cleaners[column_name]
+            names = [clean_value(value) for value in column_values]
+            ids = [self.get_owner_id(name, value if self.owner_ids_from_raw else name) if name else '' for name, value in zip(names, column_values)]
+            owner_names.append(pyarrow.array(names, pyarrow.string()).take(column_indices).fill_null('').to_pylist())
+            owner_ids.append(pyarrow.array(ids, pyarrow.string()).take(column_indices).fill_null('').to_pylist())
+
+        #--owners are added a row at a time as each one is only written the first time it is seen
+        output_list = []
+        for json_data, row_owner_names, row_owner_ids in zip(json_list, zip(*owner_names), zip(*owner_ids)):
+            self.add_owners(output_list, json_data, row_owner_names, row_owner_ids)
+            output_list.append(json_data)
+        self.capture_list_stats(output_list)
+        return output_list
+
+    #----------------------------------------
+    def convert_batch_values(self, column_values, column_indices, convert_value, bad_value_stat):
+        ''' converts the distinct values of a column, bad values are dropped and counted once per row like the csv rows count them '''
+        pyarrow = import_pyarrow()
+        converted_values = []
+        bad_values = []
+        for value in column_values:
+            converted_value = bad_value = None
+            if value:
+                try:
+                    converted_value = convert_value(value)
+                except ValueError:
+                    bad_value = value
+            converted_values.append(converted_value)
+            bad_values.append(bad_value)
+        for bad_value in pyarrow.array(bad_values, pyarrow.string()).take(column_indices).drop_null().to_pylist():
+            self.update_stat('!INFO', bad_value_stat, bad_value)
+        return converted_values
+
+    #----------------------------------------
+    def format_batch_date(self, raw_date):
+        ''' the cached date parse as a converter for convert_batch_values '''
+        formatted_date = self.cached_parse_date(raw_date)
+        if not formatted_date:
+            raise ValueError('%s is not a date' % raw_date)
+        return formatted_date
+
+    #----------------------------------------
+    @staticmethod
+    def encode_column(column):
+        ''' returns the distinct values of a pyarrow column as csv text and the index of each row into them, null for nulls '''
+        pyarrow = import_pyarrow()
+        encoded_column = pyarrow.compute.dictionary_encode(column)
+        dictionary = encoded_column.dictionary
+
+        #--floats are written like python and pandas write them to a csv, arrow would turn 94.0 into 94
+        if pyarrow.types.is_floating(dictionary.type):
+            column_values = [str(value) for value in dictionary.to_pylist()]
+        elif pyarrow.types.is_string(dictionary.type):
+            column_values = dictionary.to_pylist()
+        else:
+            column_values = pyarrow.compute.cast(dictionary, pyarrow.string()).to_pylist()
+        return column_values, encoded_column.indices
+
+    #----------------------------------------
+    def map_values(self, raw_data, getters, input_row_num = None):
+        ''' raw_data is a dict or list, getters are the itemgetters for it from compile_getters '''
+        get_mapped_values, get_key_values = getters
         json_list = []
         json_data = {}
 
-        #--clean values
-        #for attribute in raw_data:
-        #    raw_data[attribute] = self.clean_value(raw_data[attribute])
+        #--clean values, a row is checked in one pass and only rows with something to clean go through the cleaners
+        mapped_values = get_mapped_values(raw_data)
+        key_values = raw_key_values = get_key_values(raw_data)
+        if self.needs_cleaning(mapped_values + key_values):
+            mapped_values = [clean_value(value) for clean_value, value in zip(self.mapped_cleaners, mapped_values)]
+            key_values = [clean_value(value) for clean_value, value in zip(self.key_cleaners, key_values)]
+        imo = key_values[0]
 
         #--place any filters needed here
 
@@ -39,475 +588,642 @@ class mapper():
         json_data['DATA_SOURCE'] = 'SPIRE'
 
         #--the record_id should be unique, remove this mapping if there is not one
-        json_data['RECORD_ID'] = raw_data['imo']
+        json_data['RECORD_ID'] = imo
 
         #--record type is not mandatory, but should be PERSON or ORGANIZATION
         json_data['RECORD_TYPE'] = 'VESSEL'
 
-        #--column mappings
-
-        # columnName: imo
-        # 100.0 populated, 100.0 unique
-        #      9968815 (1)
-        #      9964510 (1)
-        #      9481893 (1)
-        #      9981752 (1)
-        #      9968918 (1)
-        json_data['IMO_NUMBER'] = raw_data['imo']
-
-        # columnName: mmsi
-        # 49.36 populated, 99.07 unique
-        #      357723000 (3)
-        #      374352000 (3)
-        #      357699000 (3)
-        #      351862000 (3)
-        #      372406000 (3)
-        json_data['MMSI_NUMBER'] = raw_data['mmsi']
-
-        # columnName: name
-        # 100.0 populated, 89.72 unique
-        #      GUANGZHOU WENCHONG (31)
-        #      HUANGPU WENCHONG (30)
-        #      NINGBO XINLE (26)
-        #      SHANGHAI WAIGAOQIAO (23)
-        #      CHENGXI (22)
-        json_data['VESSEL_NAME_ORG'] = raw_data['name']
-
-        # columnName: ex_name
-        # 23.07 populated, 97.9 unique
-        #      ACT (7)
-        #      Rebuilt (6)
-        #      SANYO MARU (6)
-        #      BALSA (6)
-        #      Broken up (5)
-        json_data['PRIOR_NAME_ORG'] = raw_data['ex_name']
-
-        # columnName: vessel_type
-        # 100.0 populated, 0.02 unique
-        #      Bulk Carrier (19991)
-        #      Tanker (16261)
-        #      Dry Cargo (10627)
-        #      Offshore (10045)
-        #      General Dry Cargo (8420)
-        json_data['VESSEL_TYPE'] = raw_data['vessel_type']
-
-        # columnName: vessel_subtype
-        # 71.91 populated, 0.41 unique
-        #      Dry Cargo (10365)
-        #      Bulk Carrier (5598)
-        #      Petroleum Product Tanker (5309)
-        #      Chemical Tanker (3507)
-        #      Oil Tanker (2944)
-        json_data['VESSEL_SUBTYPE'] = raw_data['vessel_subtype']
-
-        # columnName: dwt
-        # 96.71 populated, 39.63 unique
-        #      1200 (325)
-        #      1000 (244)
-        #      1500 (221)
-        #      2000 (202)
-        #      49999 (201)
-        json_data['dwt'] = raw_data['dwt']
-
-        # columnName: gross_tonnage
-        # 98.23 populated, 27.13 unique
-        #      499 (913)
-        #      1599 (383)
-        #      498 (341)
-        #      999 (287)
-        #      749 (274)
-        json_data['gross_tonnage'] = raw_data['gross_tonnage']
-
-        # columnName: displacement
-        # 6.82 populated, 49.15 unique
-        #      17472 (37)
-        #      45974 (29)
-        #      47849 (26)
-        #      58000 (25)
-        #      25281 (24)
-        json_data['displacement'] = raw_data['displacement']
-
-        # columnName: grain_cubic_capacity
-        # 26.97 populated, 31.92 unique
-        #      71634 (438)
-        #      97000 (367)
-        #      78500 (222)
-        #      77674 (139)
-        #      72360 (120)
-        json_data['grain_cubic_capacity'] = raw_data['grain_cubic_capacity']
-
-        # columnName: liquid_cubic_98_percent
-        # 23.48 populated, 50.13 unique
-        #      174000 (103)
-        #      170520 (72)
-        #      84000 (72)
-        #      3500 (59)
-        #      5000 (58)
-        json_data['liquid_cubic_98_percent'] = raw_data['liquid_cubic_98_percent']
-
-        # columnName: net_tonnage
-        # 57.11 populated, 23.19 unique
-        #      19231 (159)
-        #      149 (142)
-        #      503 (123)
-        #      20209 (87)
-        #      19142 (87)
-        json_data['net_tonnage'] = raw_data['net_tonnage']
-
-        # columnName: teu
-        # 14.63 populated, 15.92 unique
-        #      1800 (129)
-        #      4250 (88)
-        #      1118 (84)
-        #      15000 (73)
-        #      140 (69)
-        json_data['teu'] = raw_data['teu']
-
-        # columnName: tpcmi
-        # 10.24 populated, 25.48 unique
-        #      52 (144)
-        #      52.3 (111)
-        #      52.4 (74)
-        #      66.6 (70)
-        #      58.8 (66)
-        json_data['tpcmi'] = raw_data['tpcmi']
-
-        # columnName: engine_designation
-        # 83.94 populated, 8.01 unique
-        #      6S50MC-C (2255)
-        #      6S60MC (969)
-        #      6S60MC-C (887)
-        #      6S50MC (795)
-        #      6S42MC (788)
-        json_data['engine_designation'] = raw_data['engine_designation']
-
-        # columnName: main_engine_designer
-        # 85.07 populated, 0.31 unique
-        #      MAN B&W (17778)
-        #      B&W (13107)
-        #      Sulzer (6940)
-        #      Wartsila (4862)
-        #      Mitsubishi (4088)
-        json_data['main_engine_designer'] = raw_data['main_engine_designer']
-
-        # columnName: main_engines
-        # 83.98 populated, 0.02 unique
-        #      1 (61938)
-        #      2 (13203)
-        #      4 (1837)
-        #      3 (569)
-        #      6 (261)
-        json_data['main_engines'] = raw_data['main_engines']
-
-        # columnName: mco
-        # 83.11 populated, 8.11 unique
-        #      9480 (1397)
-        #      5958 (655)
-        #      13560 (613)
-        #      18660 (606)
-        #      9960 (514)
-        json_data['mco'] = raw_data['mco']
-
-        # columnName: mco_unit
-        # 96.3 populated, 0.0 unique
-        #      KW (79549)
-        #      BHP (9799)
-        #      SHP (57)
-        #      IHP (4)
-        json_data['mco_unit'] = raw_data['mco_unit']
-
-        # columnName: mcorpm
-        # 55.19 populated, 0.81 unique
-        #      127 (4339)
-        #      105 (3808)
-        #      750 (3077)
-        #      1000 (2189)
-        #      91 (1874)
-        json_data['mcorpm'] = raw_data['mcorpm']
-
-        # columnName: propellers
-        # 42.49 populated, 0.02 unique
-        #      1 (33304)
-        #      2 (5893)
-        #      3 (162)
-        #      4 (57)
-        #      6 (23)
-        json_data['propellers'] = raw_data['propellers']
-
-        # columnName: propulsion_type
-        # 83.39 populated, 0.03 unique
-        #      Motor (48545)
-        #      Diesel (24958)
-        #      Dual Fuel (973)
-        #      Common Rail (683)
-        #      Electric Motors (510)
-        json_data['propulsion_type'] = raw_data['propulsion_type']
-
-        # columnName: class_1_code
-        # 94.0 populated, 0.07 unique
-        #      uu (10418)
-        #      DNV-GL (10363)
-        #      Nippon Kaiji (NK) (9439)
-        #      American Bureau (AB) (5957)
-        #      Lloyd's Register (LR) (5735)
-        json_data['class_1_code'] = raw_data['class_1_code']
-
-        # columnName: ice_class
-        # 5.24 populated, 1.91 unique
-        #      ICE Strengthening (673)
-        #      GL - E3 (353)
-        #      DNV-GL - Ice 1A (276)
-        #      LR - 1A (230)
-        #      CC - Ice Class B (229)
-        json_data['ice_class'] = raw_data['ice_class']
-
-        # columnName: ice_classed
-        # 9.4 populated, 0.02 unique
-        #      true (4803)
-        #      false (3926)
-        json_data['ice_classed'] = raw_data['ice_classed']
-
-        # columnName: commercial_owner
-        # 56.82 populated, 13.69 unique
-        #      Unknown (4927)
-        #      NYK (405)
-        #      Mitsui O.S.K. (399)
-        #      Moller A. P. (331)
-        #      Unknown Chinese (317)
-        json_data['commercial_owner'] = raw_data['commercial_owner']
-
-        # columnName: built_year
-        # 56.81 populated, 0.17 unique
-        #      2010 (2794)
-        #      2011 (2666)
-        #      2009 (2589)
-        #      2012 (2527)
-        #      2008 (2498)
-        json_data['built_year'] = raw_data['built_year']
-
-        # columnName: dead_year
-        # 0.07 populated, 19.4 unique
-        #      2008 (34)
-        #      2017 (8)
-        #      2018 (7)
-        #      2006 (3)
-        #      2016 (3)
-        json_data['dead_year'] = raw_data['dead_year']
-
-        # columnName: vessel_age
-        # 93.45 populated, 0.14 unique
-        #      13 (3189)
-        #      12 (3089)
-        #      14 (3037)
-        #      15 (3007)
-        #      11 (2865)
-        json_data['vessel_age'] = raw_data['vessel_age']
-
-        # columnName: hull_number
-        # 94.25 populated, 31.49 unique
-        #      101 (127)
-        #      102 (102)
-        #      104 (97)
-        #      105 (95)
-        #      103 (94)
-        json_data['hull_number'] = raw_data['hull_number']
-
-        # columnName: ship_builder
-        # 98.55 populated, 5.27 unique
-        #      Hyundai Ulsan (1552)
-        #      Hyundai Mipo (1349)
-        #      Daewoo (1274)
-        #      Samsung (1268)
-        #      Imabari (1187)
-        json_data['ship_builder'] = raw_data['ship_builder']
-
-        # columnName: name_date
-        # 36.01 populated, 77.44 unique
-        #      2009-11-17 00:00:00 UTC (49)
-        #      2021-10-21 00:00:00 UTC (46)
-        #      2013-08-12 00:00:00 UTC (45)
-        #      2009-11-16 00:00:00 UTC (43)
-        #      2022-10-03 00:00:00 UTC (41)
-        json_data['name_date'] = raw_data['name_date']
-
-        # columnName: coated
-        # 11.65 populated, 0.02 unique
-        #      1 (8374)
-        #      0 (2447)
-        json_data['coated'] = raw_data['coated']
-
-        # columnName: air_draught
-        # 4.75 populated, 44.22 unique
-        #      31.4 (48)
-        #      31.5 (25)
-        #      26 (23)
-        #      40.86 (23)
-        #      40 (21)
-        json_data['air_draught'] = raw_data['air_draught']
-
-        # columnName: draught
-        # 93.0 populated, 8.87 unique
-        #      4 (755)
-        #      5 (728)
-        #      14.5 (684)
-        #      13.3 (671)
-        #      6 (670)
-        json_data['draught'] = raw_data['draught']
-
-        # columnName: ktm
-        # 7.3 populated, 25.46 unique
-        #      50 (72)
-        #      49 (65)
-        #      46 (56)
-        #      44 (56)
-        #      47 (41)
-        json_data['ktm'] = raw_data['ktm']
-
-        # columnName: loa
-        # 97.2 populated, 15.33 unique
-        #      189.99 (1188)
-        #      229 (1068)
-        #      225 (998)
-        #      199.9 (848)
-        #      183 (683)
-        json_data['loa'] = raw_data['loa']
-
-        # columnName: trading_status
-        # 100.0 populated, 0.01 unique
-        #      Existing (71581)
-        #      Scrapped (16090)
-        #      NewBuilding (4021)
-        #      TotalLoss (1100)
-        #      Converting (42)
-        json_data['trading_status'] = raw_data['trading_status']
-
-        # columnName: trading_category
-        # 81.47 populated, 0.0 unique
-        #      In Service (71623)
-        #      Newbuilding (4021)
-        json_data['trading_category'] = raw_data['trading_category']
-
-        # columnName: call_sign
-        # 66.29 populated, 97.32 unique
-        #      Unknown (5)
-        #      PY2000 (4)
-        #      3EWN5 (3)
-        #      3EGC6 (3)
-        #      3EGB2 (3)
-        json_data['CALL_SIGN'] = raw_data['call_sign']
-
-        # columnName: flag
-        # 93.31 populated, 0.23 unique
-        #      Panama (12619)
-        #      Liberia (5957)
-        #      China (4952)
-        #      Marshall Islands (4581)
-        #      Singapore (3662)
-        json_data['flag'] = raw_data['flag']
-
-        # columnName: group_owner
-        # 54.68 populated, 12.91 unique
-        #      COSCO (721)
-        #      China Government (694)
-        #      N.Y.K. Line (577)
-        #      Mitsui O.S.K. (534)
-        #      Moller, A. P. (488)
-        json_data['group_owner'] = raw_data['group_owner']
-        if raw_data['group_owner']:
-            record_id = self.compute_record_hash(raw_data['group_owner'])
-            json_data2 = {'DATA_SOURCE': json_data['DATA_SOURCE'],
-                          'RECORD_ID': record_id,
-                          'RECORD_TYPE': 'ORGANIZATION',
-                          'NAME_ORG': raw_data['group_owner'],
-                          'REL_ANCHOR_DOMAIN': json_data['DATA_SOURCE'],
-                          'REL_ANCHOR_KEY': record_id}
-            json_list.append(json_data2)
-            json_data['REL_POINTER_DOMAIN'] = json_data['DATA_SOURCE']
-            json_data['REL_POINTER_KEY'] = record_id
-            json_data['REL_POINTER_ROLE'] = 'GROUP_OWNER'
-
-        # columnName: beneficial_owner
-        # 78.49 populated, 23.88 unique
-        #      MSC (424)
-        #      N.Y.K. Line (399)
-        #      Mitsui O.S.K. (358)
-        #      Moller, A. P. (341)
-        #      Tidewater Inc. (341)
-        json_data['beneficial_owner'] = raw_data['beneficial_owner']
-        if raw_data['beneficial_owner']:
-            record_id = self.compute_record_hash(raw_data['beneficial_owner'])
-            json_data2 = {'DATA_SOURCE': json_data['DATA_SOURCE'],
-                          'RECORD_ID': record_id,
-                          'RECORD_TYPE': 'ORGANIZATION',
-                          'NAME_ORG': raw_data['beneficial_owner'],
-                          'REL_ANCHOR_DOMAIN': json_data['DATA_SOURCE'],
-                          'REL_ANCHOR_KEY': record_id}
-            json_list.append(json_data2)
-            json_data['REL_POINTER_DOMAIN'] = json_data['DATA_SOURCE']
-            json_data['REL_POINTER_KEY'] = record_id
-            json_data['REL_POINTER_ROLE'] = 'BENEFICIAL_OWNER'
-
-        # columnName: gear_type
-        # 10.42 populated, 0.04 unique
-        #      Crane (9208)
-        #      Derrick (314)
-        #      Gantry (94)
-        #      Hose-handling crane (63)
-        json_data['gear_type'] = raw_data['gear_type']
-
-        # columnName: gear_quantity
-        # 10.33 populated, 0.23 unique
-        #      4 (3312)
-        #      1 (2619)
-        #      2 (2532)
-        #      3 (987)
-        #      5 (51)
-        json_data['gear_quantity'] = raw_data['gear_quantity']
-
-        # columnName: gear_model
-        # 10.42 populated, 7.18 unique
-        #      Generic Crane (2177)
-        #      Generic Crane Gearless (1343)
-        #      Generic Crane Undisclosed 30 (872)
-        #      Generic Crane Undisclosed 30.5 (311)
-        #      Generic Derrick (264)
-        json_data['gear_model'] = raw_data['gear_model']
-
-        # columnName: beam_extreme
-        # 89.92 populated, 4.07 unique
-        #      32.26 (5259)
-        #      32.2 (2707)
-        #      32.24 (1323)
-        #      45 (1050)
-        #      16 (990)
-        json_data['beam_extreme'] = raw_data['beam_extreme']
-
-        #--remove empty attributes and capture the stats
-        json_data = self.remove_empty_tags(json_data)
+        #--column mappings, compiled by load_reference_data, empty values are skipped here so no second pass is needed
+        for attribute, value in zip(self.mapped_attributes, mapped_values):
+            if value:
+                json_data[attribute] = value
+        for attribute in self.date_attributes:
+            if attribute in json_data:
+                raw_date = json_data[attribute]
+                formatted_date = self.cached_parse_date(raw_date)
+                if formatted_date:
+                    json_data[attribute] = formatted_date
+                else:
+                    self.update_stat('!INFO', 'BAD_DATE', raw_date)
+                    del json_data[attribute]
+        for attribute, convert_value, value_type in self.typed_attributes:
+            if attribute in json_data:
+                try:
+                    json_data[attribute] = convert_value(json_data[attribute])
+                except ValueError:
+                    self.update_stat('!INFO', 'BAD_' + value_type.upper(), json_data.pop(attribute))
+
+        #--owners are written as their own organization records related to the vessel, one relationship per role
+        owner_names = key_values[1:]
+        owner_keys = raw_key_values[1:] if self.owner_ids_from_raw else owner_names
+        owner_ids = list(map(self.owner_index.get, owner_keys))
+        if None in owner_ids:
+            owner_ids = [self.get_owner_id(owner_name, owner_key) if owner_name else '' for owner_name, owner_key in zip(owner_names, owner_keys)]
+        self.add_owners(json_list, json_data, owner_names, owner_ids)
+
         json_list.append(json_data)
 
+        #--capture the stats
+        self.capture_list_stats(json_list)
+
+        return json_list
+
+    #----------------------------------------
+    def get_owner_id(self, owner_name, owner_key):
+        ''' owner_key is the raw or cleaned owner name, placeholder names get an empty id so no owner is written for them '''
+        record_id = self.owner_index.get(owner_key)
+        if record_id is None:
+            if owner_name.upper() in self.variant_data['OWNER_GARBAGE_VALUES']:
+                record_id = self.owner_index[owner_key] = ''
+            else:
+                record_id = self.owner_index[owner_key] = self.compute_owner_id(owner_key)
+        return record_id
+
+    #----------------------------------------
+    def add_owners(self, json_list, json_data, owner_names, owner_ids):
+        ''' adds each owner seen for the first time to json_list and a relationship to every owner to the vessel '''
+        relationships = []
+        for owner_role, owner_name, record_id in zip(self.owner_roles.values(), owner_names, owner_ids):
+            if not record_id:
+                continue
+            if self.is_new_owner(record_id):
+                json_list.append({'DATA_SOURCE': json_data['DATA_SOURCE'],
+                                  'RECORD_ID': record_id,
+                                  'RECORD_TYPE': 'ORGANIZATION',
+                                  'NAME_ORG': owner_name,
+                                  'REL_ANCHOR_DOMAIN': json_data['DATA_SOURCE'],
+                                  'REL_ANCHOR_KEY': record_id})
+            relationships.append({'REL_POINTER_DOMAIN': json_data['DATA_SOURCE'],
+                                  'REL_POINTER_KEY': record_id,
+                                  'REL_POINTER_ROLE': owner_role})
+        if relationships:
+            json_data['RELATIONSHIPS'] = relationships
+
+    #----------------------------------------
+    def capture_list_stats(self, json_list):
+        ''' captures the stats of mapped records, the owners only when this mapper writes them '''
+        start_time = time.perf_counter() if self.stage_times is not None else 0
         for json_data in json_list:
+            if json_data['RECORD_TYPE'] == 'ORGANIZATION' and not self.capture_owner_stats:
+                continue
             self.capture_mapped_stats(json_data)
+        if self.stage_times is not None:
+            self.stage_times['stats'] += time.perf_counter() - start_time
 
-
-        return json_list
+    #----------------------------------------
+    def check_header(self, header):
+        ''' makes sure every mapped column is in the csv header '''
+        for column in list(self.column_mappings) + list(self.key_columns):
+            if column not in header:
+                raise ValueError('column %s not found in the csv header' % column)
 
     #----------------------------------------
-    def load_reference_data(self):
+    def load_reference_data(self, mapping_file = None, columns = None, payload = True, typed_values = False):
 
         #--garabage values
         self.variant_data = {}
-        self.variant_data['GARBAGE_VALUES'] = ['NULL', 'NUL', 'N/A']
+        self.variant_data['GARBAGE_VALUES'] = {'NULL', 'NUL', 'N/A'}
+
+        #--placeholder owner names, the owner column keeps them but no organization record or relationship is written
+        self.variant_data['OWNER_GARBAGE_VALUES'] = {'UNKNOWN', 'UNKNOWN CHINESE', 'UNKNOWN OWNER', 'NOT KNOWN'}
+
+        #--column mappings, spire column name: senzing or payload attribute
+        self.column_mappings = {
+            # columnName: imo
+            # 100.0 populated, 100.0 unique
+            #      9968815 (1)
+            #      9964510 (1)
+            #      9481893 (1)
+            #      9981752 (1)
+            #      9968918 (1)
+            'imo': 'IMO_NUMBER',
+
+            # columnName: mmsi
+            # 49.36 populated, 99.07 unique
+            #      357723000 (3)
+            #      374352000 (3)
+            #      357699000 (3)
+            #      351862000 (3)
+            #      372406000 (3)
+            'mmsi': 'MMSI_NUMBER',
+
+            # columnName: name
+            # 100.0 populated, 89.72 unique
+            #      GUANGZHOU WENCHONG (31)
+            #      HUANGPU WENCHONG (30)
+            #      NINGBO XINLE (26)
+            #      SHANGHAI WAIGAOQIAO (23)
+            #      CHENGXI (22)
+            'name': 'VESSEL_NAME_ORG',
+
+            # columnName: ex_name
+            # 23.07 populated, 97.9 unique
+            #      ACT (7)
+            #      Rebuilt (6)
+            #      SANYO MARU (6)
+            #      BALSA (6)
+            #      Broken up (5)
+            'ex_name': 'PRIOR_NAME_ORG',
+
+            # columnName: vessel_type
+            # 100.0 populated, 0.02 unique
+            #      Bulk Carrier (19991)
+            #      Tanker (16261)
+            #      Dry Cargo (10627)
+            #      Offshore (10045)
+            #      General Dry Cargo (8420)
+            'vessel_type': 'VESSEL_TYPE',
+
+            # columnName: vessel_subtype
+            # 71.91 populated, 0.41 unique
+            #      Dry Cargo (10365)
+            #      Bulk Carrier (5598)
+            #      Petroleum Product Tanker (5309)
+            #      Chemical Tanker (3507)
+            #      Oil Tanker (2944)
+            'vessel_subtype': 'VESSEL_SUBTYPE',
+
+            # columnName: dwt
+            # 96.71 populated, 39.63 unique
+            #      1200 (325)
+            #      1000 (244)
+            #      1500 (221)
+            #      2000 (202)
+            #      49999 (201)
+            'dwt': 'dwt',
+
+            # columnName: gross_tonnage
+            # 98.23 populated, 27.13 unique
+            #      499 (913)
+            #      1599 (383)
+            #      498 (341)
+            #      999 (287)
+            #      749 (274)
+            'gross_tonnage': 'gross_tonnage',
+
+            # columnName: displacement
+            # 6.82 populated, 49.15 unique
+            #      17472 (37)
+            #      45974 (29)
+            #      47849 (26)
+            #      58000 (25)
+            #      25281 (24)
+            'displacement': 'displacement',
+
+            # columnName: grain_cubic_capacity
+            # 26.97 populated, 31.92 unique
+            #      71634 (438)
+            #      97000 (367)
+            #      78500 (222)
+            #      77674 (139)
+            #      72360 (120)
+            'grain_cubic_capacity': 'grain_cubic_capacity',
+
+            # columnName: liquid_cubic_98_percent
+            # 23.48 populated, 50.13 unique
+            #      174000 (103)
+            #      170520 (72)
+            #      84000 (72)
+            #      3500 (59)
+            #      5000 (58)
+            'liquid_cubic_98_percent': 'liquid_cubic_98_percent',
+
+            # columnName: net_tonnage
+            # 57.11 populated, 23.19 unique
+            #      19231 (159)
+            #      149 (142)
+            #      503 (123)
+            #      20209 (87)
+            #      19142 (87)
+            'net_tonnage': 'net_tonnage',
+
+            # columnName: teu
+            # 14.63 populated, 15.92 unique
+            #      1800 (129)
+            #      4250 (88)
+            #      1118 (84)
+            #      15000 (73)
+            #      140 (69)
+            'teu': 'teu',
+
+            # columnName: tpcmi
+            # 10.24 populated, 25.48 unique
+            #      52 (144)
+            #      52.3 (111)
+            #      52.4 (74)
+            #      66.6 (70)
+            #      58.8 (66)
+            'tpcmi': 'tpcmi',
+
+            # columnName: engine_designation
+            # 83.94 populated, 8.01 unique
+            #      6S50MC-C (2255)
+            #      6S60MC (969)
+            #      6S60MC-C (887)
+            #      6S50MC (795)
+            #      6S42MC (788)
+            'engine_designation': 'engine_designation',
+
+            # columnName: main_engine_designer
+            # 85.07 populated, 0.31 unique
+            #      MAN B&W (17778)
+            #      B&W (13107)
+            #      Sulzer (6940)
+            #      Wartsila (4862)
+            #      Mitsubishi (4088)
+            'main_engine_designer': 'main_engine_designer',
+
+            # columnName: main_engines
+            # 83.98 populated, 0.02 unique
+            #      1 (61938)
+            #      2 (13203)
+            #      4 (1837)
+            #      3 (569)
+            #      6 (261)
+            'main_engines': 'main_engines',
+
+            # columnName: mco
+            # 83.11 populated, 8.11 unique
+            #      9480 (1397)
+            #      5958 (655)
+            #      13560 (613)
+            #      18660 (606)
+            #      9960 (514)
+            'mco': 'mco',
+
+            # columnName: mco_unit
+            # 96.3 populated, 0.0 unique
+            #      KW (79549)
+            #      BHP (9799)
+            #      SHP (57)
+            #      IHP (4)
+            'mco_unit': 'mco_unit',
+
+            # columnName: mcorpm
+            # 55.19 populated, 0.81 unique
+            #      127 (4339)
+            #      105 (3808)
+            #      750 (3077)
+            #      1000 (2189)
+            #      91 (1874)
+            'mcorpm': 'mcorpm',
+
+            # columnName: propellers
+            # 42.49 populated, 0.02 unique
+            #      1 (33304)
+            #      2 (5893)
+            #      3 (162)
+            #      4 (57)
+            #      6 (23)
+            'propellers': 'propellers',
+
+            # columnName: propulsion_type
+            # 83.39 populated, 0.03 unique
+            #      Motor (48545)
+            #      Diesel (24958)
+            #      Dual Fuel (973)
+            #      Common Rail (683)
+            #      Electric Motors (510)
+            'propulsion_type': 'propulsion_type',
+
+            # columnName: class_1_code
+            # 94.0 populated, 0.07 unique
+            #      uu (10418)
+            #      DNV-GL (10363)
+            #      Nippon Kaiji (NK) (9439)
+            #      American Bureau (AB) (5957)
+            #      Lloyd's Register (LR) (5735)
+            'class_1_code': 'class_1_code',
+
+            # columnName: ice_class
+            # 5.24 populated, 1.91 unique
+            #      ICE Strengthening (673)
+            #      GL - E3 (353)
+            #      DNV-GL - Ice 1A (276)
+            #      LR - 1A (230)
+            #      CC - Ice Class B (229)
+            'ice_class': 'ice_class',
+
+            # columnName: ice_classed
+            # 9.4 populated, 0.02 unique
+            #      true (4803)
+            #      false (3926)
+            'ice_classed': 'ice_classed',
+
+            # columnName: commercial_owner
+            # 56.82 populated, 13.69 unique
+            #      Unknown (4927)
+            #      NYK (405)
+            #      Mitsui O.S.K. (399)
+            #      Moller A. P. (331)
+            #      Unknown Chinese (317)
+            'commercial_owner': 'commercial_owner',
+
+            # columnName: built_year
+            # 56.81 populated, 0.17 unique
+            #      2010 (2794)
+            #      2011 (2666)
+            #      2009 (2589)
+            #      2012 (2527)
+            #      2008 (2498)
+            'built_year': 'DATE_OF_BIRTH',
+
+            # columnName: dead_year
+            # 0.07 populated, 19.4 unique
+            #      2008 (34)
+            #      2017 (8)
+            #      2018 (7)
+            #      2006 (3)
+            #      2016 (3)
+            'dead_year': 'DATE_OF_DEATH',
+
+            # columnName: vessel_age
+            # 93.45 populated, 0.14 unique
+            #      13 (3189)
+            #      12 (3089)
+            #      14 (3037)
+            #      15 (3007)
+            #      11 (2865)
+            'vessel_age': 'vessel_age',
+
+            # columnName: hull_number
+            # 94.25 populated, 31.49 unique
+            #      101 (127)
+            #      102 (102)
+            #      104 (97)
+            #      105 (95)
+            #      103 (94)
+            'hull_number': 'hull_number',
+
+            # columnName: ship_builder
+            # 98.55 populated, 5.27 unique
+            #      Hyundai Ulsan (1552)
+            #      Hyundai Mipo (1349)
+            #      Daewoo (1274)
+            #      Samsung (1268)
+            #      Imabari (1187)
+            'ship_builder': 'ship_builder',
+
+            # columnName: name_date
+            # 36.01 populated, 77.44 unique
+            #      2009-11-17 00:00:00 UTC (49)
+            #      2021-10-21 00:00:00 UTC (46)
+            #      2013-08-12 00:00:00 UTC (45)
+            #      2009-11-16 00:00:00 UTC (43)
+            #      2022-10-03 00:00:00 UTC (41)
+            'name_date': 'REGISTRATION_DATE',
+
+            # columnName: coated
+            # 11.65 populated, 0.02 unique
+            #      1 (8374)
+            #      0 (2447)
+            'coated': 'coated',
+
+            # columnName: air_draught
+            # 4.75 populated, 44.22 unique
+            #      31.4 (48)
+            #      31.5 (25)
+            #      26 (23)
+            #      40.86 (23)
+            #      40 (21)
+            'air_draught': 'air_draught',
+
+            # columnName: draught
+            # 93.0 populated, 8.87 unique
+            #      4 (755)
+            #      5 (728)
+            #      14.5 (684)
+            #      13.3 (671)
+            #      6 (670)
+            'draught': 'draught',
+
+            # columnName: ktm
+            # 7.3 populated, 25.46 unique
+            #      50 (72)
+            #      49 (65)
+            #      46 (56)
+            #      44 (56)
+            #      47 (41)
+            'ktm': 'ktm',
+
+            # columnName: loa
+            # 97.2 populated, 15.33 unique
+            #      189.99 (1188)
+            #      229 (1068)
+            #      225 (998)
+            #      199.9 (848)
+            #      183 (683)
+            'loa': 'loa',
+
+            # columnName: trading_status
+            # 100.0 populated, 0.01 unique
+            #      Existing (71581)
+            #      Scrapped (16090)
+            #      NewBuilding (4021)
+            #      TotalLoss (1100)
+            #      Converting (42)
+            'trading_status': 'trading_status',
+
+            # columnName: trading_category
+            # 81.47 populated, 0.0 unique
+            #      In Service (71623)
+            #      Newbuilding (4021)
+            'trading_category': 'trading_category',
+
+            # columnName: call_sign
+            # 66.29 populated, 97.32 unique
+            #      Unknown (5)
+            #      PY2000 (4)
+            #      3EWN5 (3)
+            #      3EGC6 (3)
+            #      3EGB2 (3)
+            'call_sign': 'CALL_SIGN',
+
+            # columnName: flag
+            # 93.31 populated, 0.23 unique
+            #      Panama (12619)
+            #      Liberia (5957)
+            #      China (4952)
+            #      Marshall Islands (4581)
+            #      Singapore (3662)
+            'flag': 'flag',
+
+            # columnName: group_owner
+            # 54.68 populated, 12.91 unique
+            #      COSCO (721)
+            #      China Government (694)
+            #      N.Y.K. Line (577)
+            #      Mitsui O.S.K. (534)
+            #      Moller, A. P. (488)
+            'group_owner': 'group_owner',
+
+            # columnName: beneficial_owner
+            # 78.49 populated, 23.88 unique
+            #      MSC (424)
+            #      N.Y.K. Line (399)
+            #      Mitsui O.S.K. (358)
+            #      Moller, A. P. (341)
+            #      Tidewater Inc. (341)
+            'beneficial_owner': 'beneficial_owner',
+
+            # columnName: gear_type
+            # 10.42 populated, 0.04 unique
+            #      Crane (9208)
+            #      Derrick (314)
+            #      Gantry (94)
+            #      Hose-handling crane (63)
+            'gear_type': 'gear_type',
+
+            # columnName: gear_quantity
+            # 10.33 populated, 0.23 unique
+            #      4 (3312)
+            #      1 (2619)
+            #      2 (2532)
+            #      3 (987)
+            #      5 (51)
+            'gear_quantity': 'gear_quantity',
+
+            # columnName: gear_model
+            # 10.42 populated, 7.18 unique
+            #      Generic Crane (2177)
+            #      Generic Crane Gearless (1343)
+            #      Generic Crane Undisclosed 30 (872)
+            #      Generic Crane Undisclosed 30.5 (311)
+            #      Generic Derrick (264)
+            'gear_model': 'gear_model',
+
+            # columnName: beam_extreme
+            # 89.92 populated, 4.07 unique
+            #      32.26 (5259)
+            #      32.2 (2707)
+            #      32.24 (1323)
+            #      45 (1050)
+            #      16 (990)
+            'beam_extreme': 'beam_extreme'
+        }
+
+        #--a mapping file can remap columns, add new ones or drop them with a null attribute
+        if mapping_file:
+            with open(mapping_file, 'r') as f:
+                self.column_mappings.update(json.load(f))
+            self.column_mappings = {column: attribute for column, attribute in self.column_mappings.items() if attribute}
+
+        #--owner columns, each becomes an organization record related to the vessel in this role
+        self.owner_roles = {'group_owner': 'GROUP_OWNER',
+                            'beneficial_owner': 'BENEFICIAL_OWNER',
+                            'commercial_owner': 'COMMERCIAL_OWNER'}
+
+        #--columns map_values reads directly for the record_id and the owner records
+        self.key_columns = ('imo',) + tuple(self.owner_roles)
+
+        #--projection, only the listed columns or the ones mapped to senzing attributes are mapped, the key columns always are
+        if columns:
+            for column in columns:
+                if column not in self.column_mappings and column not in self.key_columns:
+                    raise ValueError('column %s is not in the mappings' % column)
+            self.column_mappings = {column: attribute for column, attribute in self.column_mappings.items() if column in columns or column in self.key_columns}
+        if not payload:
+            self.column_mappings = {column: attribute for column, attribute in self.column_mappings.items() if attribute.isupper()}
+
+        #--every column the mappings read, only these are read from columnar files
+        self.input_columns = list(dict.fromkeys(list(self.column_mappings) + list(self.key_columns)))
+
+        #--columns with few distinct values, under 10% unique in the profiling comments, are cleaned through an lru cache
+        self.cached_columns = {'vessel_type', 'vessel_subtype', 'engine_designation', 'main_engine_designer', 'main_engines',
+                               'mco', 'mco_unit', 'mcorpm', 'propellers', 'propulsion_type', 'class_1_code', 'ice_class',
+                               'ice_classed', 'built_year', 'vessel_age', 'ship_builder', 'coated', 'draught', 'trading_status',
+                               'trading_category', 'flag', 'gear_type', 'gear_quantity', 'gear_model', 'beam_extreme',
+                               'commercial_owner', 'group_owner', 'beneficial_owner'}
+        self.clean_cache_size = 10000
+        self.value_cleaners = {}
+        for column in list(self.column_mappings) + list(self.key_columns):
+            if column in self.cached_columns:
+                self.value_cleaners[column] = functools.lru_cache(maxsize=self.clean_cache_size)(self.clean_value)
+            else:
+                self.value_cleaners[column] = self.clean_value
+        self.cache_counts = {}
+
+        #--date columns are normalized on every row, each distinct raw value is only parsed once
+        self.date_columns = ('built_year', 'dead_year', 'name_date')
+        self.date_attributes = tuple(self.column_mappings[column] for column in self.date_columns if column in self.column_mappings)
+        self.date_cache_size = 100000
+        self.cached_parse_date = functools.lru_cache(maxsize=self.date_cache_size)(self.parse_date)
+
+        #--numeric and boolean columns, only converted from strings when typed values are asked for
+        self.column_types = {'dwt': 'integer', 'gross_tonnage': 'integer', 'displacement': 'integer', 'grain_cubic_capacity': 'integer',
+                             'liquid_cubic_98_percent': 'integer', 'net_tonnage': 'integer', 'teu': 'integer', 'main_engines': 'integer',
+                             'mco': 'integer', 'mcorpm': 'integer', 'propellers': 'integer', 'vessel_age': 'integer', 'gear_quantity': 'integer',
+                             'tpcmi': 'decimal', 'air_draught': 'decimal', 'draught': 'decimal', 'ktm': 'decimal', 'loa': 'decimal',
+                             'beam_extreme': 'decimal', 'ice_classed': 'boolean', 'coated': 'boolean'}
+        self.boolean_values = {'true': True, 'false': False, '1': True, '0': False, 'yes': True, 'no': False, 'y': True, 'n': False}
+        value_converters = {'integer': self.to_integer, 'decimal': self.to_decimal, 'boolean': self.to_boolean}
+        self.typed_attributes = ()
+        if typed_values:
+            self.typed_attributes = tuple((self.column_mappings[column], value_converters[value_type], value_type)
+                                          for column, value_type in self.column_types.items() if column in self.column_mappings)
+
+        #--compile the mappings into a single itemgetter call per row
+        self.mapped_attributes = tuple(self.column_mappings.values())
+        self.mapped_cleaners = tuple(self.value_cleaners[column] for column in self.column_mappings)
+        self.key_cleaners = tuple(self.value_cleaners[column] for column in self.key_columns)
+        self.dict_getters = self.compile_getters()
+
+    #----------------------------------------
+    def compile_getters(self, column_indexes = None):
+        ''' builds itemgetters for dict rows by column name, or for list rows by column_indexes '''
+        if column_indexes:
+            mapped_keys = [column_indexes[column] for column in self.column_mappings]
+            key_keys = [column_indexes[column] for column in self.key_columns]
+        else:
+            mapped_keys = list(self.column_mappings)
+            key_keys = list(self.key_columns)
+
+        if len(mapped_keys) == 1:
+            mapped_key = mapped_keys[0]
+            def get_mapped_values(raw_data):
+                return (raw_data[mapped_key],)
+        else:
+            get_mapped_values = operator.itemgetter(*mapped_keys)
+        return get_mapped_values, operator.itemgetter(*key_keys)
 
     #-----------------------------------
     def clean_value(self, raw_value):
         if not raw_value:
             return ''
-        new_value = ' '.join(str(raw_value).strip().split())
+        new_value = ' '.join(str(raw_value).split())
         if new_value.upper() in self.variant_data['GARBAGE_VALUES']:
             return ''
         return new_value
 
+    #-----------------------------------
+    def needs_cleaning(self, values):
+        ''' checks a whole row with string methods, cheaper than cleaning each value when most rows are already clean '''
+        try:
+            row_text = '|' + '|'.join(values) + '|'
+        except TypeError:
+            return True
+        if '  ' in row_text or '| ' in row_text or ' |' in row_text or not row_text.isprintable():
+            return True
+        row_text = row_text.upper()
+        for garbage_value in self.variant_data['GARBAGE_VALUES']:
+            if '|' + garbage_value + '|' in row_text:
+                return True
+        return False
+
+    #-----------------------------------
+    def capture_cache_stats(self):
+        ''' adds the cleaning and date cache hits and misses since the last call to the stats '''
+        for column, clean_value in list(self.value_cleaners.items()) + [('dates', self.cached_parse_date)]:
+            if not hasattr(clean_value, 'cache_info'):
+                continue
+            cache_info = clean_value.cache_info()
+            last_hits, last_misses = self.cache_counts.get(column, (0, 0))
+            if cache_info.hits > last_hits:
+                self.stat_pack.add_count('!CLEAN_CACHE_HITS', column, cache_info.hits - last_hits)
+            if cache_info.misses > last_misses:
+                self.stat_pack.add_count('!CLEAN_CACHE_MISSES', column, cache_info.misses - last_misses)
+            self.cache_counts[column] = (cache_info.hits, cache_info.misses)
+
     #-----------------------------------
     def compute_record_hash(self, target_dict, attr_list = None):
         if attr_list:
@@ -518,14 +1234,70 @@ class mapper():
             string_to_hash = json.dumps(target_dict, sort_keys=True)
         return hashlib.md5(bytes(string_to_hash, 'utf-8')).hexdigest()
 
+    #----------------------------------------
+    def is_new_owner(self, record_id):
+        if not self.dedupe_owners:
+            return True
+        if record_id in self.owner_record_ids:
+            self.update_stat('!INFO', 'DUPLICATE_OWNER_SUPPRESSED')
+            return False
+        self.owner_record_ids.add(record_id)
+        return True
+
     #----------------------------------------
     def format_date(self, raw_date):
+        ''' normalizes a date to YYYY-MM-DD, or YYYY for a year alone, and returns an empty string for a bad one '''
+        formatted_date = self.cached_parse_date(raw_date)
+        if not formatted_date:
+            self.update_stat('!INFO', 'BAD_DATE', raw_date)
+        return formatted_date
+
+    #----------------------------------------
+    def parse_date(self, raw_date):
+        ''' tries the fixed layouts spire uses before falling back to dateutil '''
+        if raw_date.isdigit():
+            return raw_date if len(raw_date) == 4 else ''
+        if len(raw_date) >= 10 and raw_date[4] == '-' and raw_date[10:] in ('', ' 00:00:00 UTC', ' 00:00:00', 'T00:00:00Z'):
+            try:
+                return date.fromisoformat(raw_date[:10]).isoformat()
+            except ValueError:
+                return ''
+        from dateutil.parser import parse as dateparse # pylint: disable=import-outside-toplevel
         try:
             return datetime.strftime(dateparse(raw_date), '%Y-%m-%d')
-        except:
-            self.update_stat('!INFO', 'BAD_DATE', raw_date)
+        except (ValueError, OverflowError):
             return ''
 
+    #----------------------------------------
+    def to_integer(self, raw_value):
+        ''' the typed value converters raise ValueError for a value that is not of their type '''
+        try:
+            number = int(raw_value)
+        except ValueError:
+            decimal_number = self.to_decimal(raw_value)
+            if not decimal_number.is_integer():
+                raise
+            number = int(decimal_number)
+
+        #--orjson and msgpack only write signed 64 bit integers
+        if not -2 ** 63 <= number < 2 ** 63:
+            raise ValueError('%s is outside the 64 bit integer range' % raw_value)
+        return number
+
+    #----------------------------------------
+    def to_decimal(self, raw_value):
+        number = float(raw_value)
+        if not math.isfinite(number):
+            raise ValueError('%s is not a finite number' % raw_value)
+        return number
+
+    #----------------------------------------
+    def to_boolean(self, raw_value):
+        boolean_value = self.boolean_values.get(raw_value.lower())
+        if boolean_value is None:
+            raise ValueError('%s is not a boolean' % raw_value)
+        return boolean_value
+
     #----------------------------------------
     def remove_empty_tags(self, d):
         if isinstance(d, dict):
@@ -541,36 +1313,1223 @@ class mapper():
 
     #----------------------------------------
     def update_stat(self, cat1, cat2, example=None):
+        self.stat_pack.update(cat1, cat2, example)
+
+    #----------------------------------------
+    def capture_mapped_stats(self, json_data):
+        if not self.capture_stats:
+            return
+        self.stat_pack.add_record(json_data.get('RECORD_TYPE', 'UNKNOWN'), json_data)
+
+#--set in each worker process by init_worker
+worker_mapper = None
+worker_stats_seed = None
+worker_content_hash = False
+worker_serialize = None
+worker_stage_times = False
+worker_record_batches = False
+
+#=========================
+class delta_state(): # pylint: disable=too-many-instance-attributes
+    ''' sorted on disk record_id -> content hash store for incremental runs '''
+
+    #--fixed width entries: record_id, record type code, md5 digest of the content
+    entry_format = '64s1s16s'
+    entry_size = struct.calcsize(entry_format)
+    record_type_codes = {'VESSEL': b'V', 'ORGANIZATION': b'O'}
+
+    #----------------------------------------
+    def __init__(self, state_file_name, previous_output_file_name = None, run_size = 500000):
+        self.state_file_name = state_file_name
+        self.run_size = run_size
+        self.run_entries = []
+        self.run_files = []
+        self.status_counts = {'NEW': 0, 'CHANGED': 0, 'UNCHANGED': 0, 'DELETED': 0}
+
+        self.previous_file_handle = None
+        self.previous_map = None
+        self.previous_count = 0
+        self.previous_temp_name = None
+        if previous_output_file_name:
+            self.previous_temp_name = self.build_from_output(previous_output_file_name)
+            self.open_previous(self.previous_temp_name)
+        elif os.path.exists(state_file_name):
+            self.open_previous(state_file_name)
+
+    #----------------------------------------
+    def open_previous(self, file_name):
+        self.previous_file_handle = open(file_name, 'rb')
+        file_size = os.fstat(self.previous_file_handle.fileno()).st_size
+        if file_size % self.entry_size:
+            raise ValueError('%s is not a valid delta state file' % file_name)
+        self.previous_count = file_size // self.entry_size
+        if self.previous_count:
+            self.previous_map = mmap.mmap(self.previous_file_handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    #----------------------------------------
+    def make_entry(self, record_id, record_type, content_hash):
+        record_key = record_id.encode('utf-8')
+        if len(record_key) > 64:
+            raise ValueError('record_id %s is too long for the delta state file' % record_id)
+        return struct.pack(self.entry_format, record_key, self.record_type_codes.get(record_type, b'?'), bytes.fromhex(content_hash))
+
+    #----------------------------------------
+    def find_previous(self, record_key):
+        ''' binary search of the memory mapped previous state, returns the entry or None '''
+        low = 0
+        high = self.previous_count
+        while low < high:
+            mid = (low + high) // 2
+            offset = mid * self.entry_size
+            mid_key = self.previous_map[offset: offset + 64]
+            if mid_key < record_key:
+                low = mid + 1
+            elif mid_key > record_key:
+                high = mid
+            else:
+                return self.previous_map[offset: offset + self.entry_size]
+        return None
+
+    #----------------------------------------
+    def check(self, record_id, record_type, content_hash):
+        ''' returns NEW, CHANGED or UNCHANGED and remembers the record for the next run '''
+        entry = self.make_entry(record_id, record_type, content_hash)
+        self.add_entry(entry)
+        previous_entry = self.find_previous(entry[:64]) if self.previous_map else None
+        if not previous_entry:
+            status = 'NEW'
+        elif previous_entry != entry:
+            status = 'CHANGED'
+        else:
+            status = 'UNCHANGED'
+        self.status_counts[status] += 1
+        return status
+
+    #----------------------------------------
+    def add_entry(self, entry):
+        self.run_entries.append(entry)
+        if len(self.run_entries) >= self.run_size:
+            self.flush_run()
+
+    #----------------------------------------
+    def flush_run(self):
+        ''' spills the buffered entries to disk as a sorted run '''
+        if not self.run_entries:
+            return
+        import tempfile # pylint: disable=import-outside-toplevel
+        self.run_entries.sort()
+        run_file = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(self.state_file_name)))
+        run_file.write(b''.join(self.run_entries))
+        run_file.seek(0)
+        self.run_files.append(run_file)
+        self.run_entries = []
+
+    #----------------------------------------
+    def read_entries(self, file_handle):
+        while True:
+            entry = file_handle.read(self.entry_size)
+            if len(entry) < self.entry_size:
+                return
+            yield entry
+
+    #----------------------------------------
+    def sorted_entries(self):
+        ''' merges the sorted runs, keeping the last entry for any repeated record_id '''
+        self.flush_run()
+        merged_entries = heapq.merge(*[self.read_entries(run_file) for run_file in self.run_files])
+        last_entry = next(merged_entries, b'')
+        if not last_entry:
+            return
+        for entry in merged_entries:
+            if last_entry[:64] != entry[:64]:
+                yield last_entry
+            last_entry = entry
+        yield last_entry
+
+    #----------------------------------------
+    def build_from_output(self, output_file_name):
+        ''' builds a temporary state file from a previous run's full output '''
+        input_file_handle, input_binary_handle = open_input_file(output_file_name)
+        for line in input_file_handle:
+            if not line.strip():
+                continue
+            json_data = json.loads(line)
+            if json_data.get('DSRC_ACTION') == 'D':
+                continue
+            content_hash = hashlib.md5(bytes(json.dumps(json_data, sort_keys=True), 'utf-8')).hexdigest()
+            self.add_entry(self.make_entry(json_data['RECORD_ID'], json_data.get('RECORD_TYPE'), content_hash))
+        close_file(input_file_handle, input_binary_handle)
+
+        import tempfile # pylint: disable=import-outside-toplevel
+        temp_file_handle, temp_file_name = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.state_file_name)))
+        with os.fdopen(temp_file_handle, 'wb') as state_file:
+            for entry in self.sorted_entries():
+                state_file.write(entry)
+        self.close_runs()
+        return temp_file_name
+
+    #----------------------------------------
+    def close_runs(self):
+        for run_file in self.run_files:
+            run_file.close()
+        self.run_files = []
+
+    #----------------------------------------
+    def finish(self, data_source):
+        ''' writes the new state file and returns delete records for the previous records not seen this run '''
+        new_state_file_name = self.state_file_name + '.new'
+        previous_entries = iter(())
+        if self.previous_map:
+            previous_entries = (self.previous_map[i * self.entry_size: (i + 1) * self.entry_size] for i in range(self.previous_count))
+
+        previous_entry = next(previous_entries, None)
+        with open(new_state_file_name, 'wb') as state_file:
+            for entry in self.sorted_entries():
+                state_file.write(entry)
+                while previous_entry and previous_entry[:64] < entry[:64]:
+                    yield self.delete_record(data_source, previous_entry)
+                    previous_entry = next(previous_entries, None)
+                if previous_entry and previous_entry[:64] == entry[:64]:
+                    previous_entry = next(previous_entries, None)
+        while previous_entry:
+            yield self.delete_record(data_source, previous_entry)
+            previous_entry = next(previous_entries, None)
+
+        self.close()
+        os.replace(new_state_file_name, self.state_file_name)
+
+    #----------------------------------------
+    def delete_record(self, data_source, entry):
+        self.status_counts['DELETED'] += 1
+        return {'DATA_SOURCE': data_source,
+                'RECORD_ID': entry[:64].rstrip(b'\x00').decode('utf-8'),
+                'DSRC_ACTION': 'D'}
+
+    #----------------------------------------
+    def close(self):
+        self.close_runs()
+        if self.previous_map:
+            self.previous_map.close()
+            self.previous_map = None
+        if self.previous_file_handle:
+            self.previous_file_handle.close()
+            self.previous_file_handle = None
+        if self.previous_temp_name:
+            os.remove(self.previous_temp_name)
+            self.previous_temp_name = None
+
+#=========================
+class record_writer(): # pylint: disable=too-many-instance-attributes
+    ''' serializes records and writes them to a file in large batches '''
+
+    #----------------------------------------
+    def __init__(self, file_handle, json_library = 'auto', batch_records = 1000, batch_bytes = 1048576):
+        self.file_handle = file_handle
+        self.serialize = get_json_serializer(json_library)
+
+        #--msgpack records are a plain stream of bytes with no line breaks between them
+        self.binary = json_library == 'msgpack'
+        self.batch_records = batch_records
+        self.batch_bytes = batch_bytes
+        self.batch = []
+        self.batch_size = 0
+
+        #--set to a dict by run_metrics to time serialization and writes
+        self.stage_times = None
+
+    #----------------------------------------
+    def write(self, json_data):
+        if self.stage_times is None:
+            self.write_line(self.serialize(json_data))
+        else:
+            start_time = time.perf_counter()
+            output_row = self.serialize(json_data)
+            self.stage_times['serialize'] += time.perf_counter() - start_time
+            self.write_line(output_row)
+
+    #----------------------------------------
+    def write_line(self, output_row, record_id = None, shard_key = None):
+        self.batch.append(output_row)
+        self.batch_size += len(output_row)
+        if len(self.batch) >= self.batch_records or self.batch_size >= self.batch_bytes:
+            self.flush()
+
+    #----------------------------------------
+    def flush(self):
+        if self.batch:
+            start_time = time.perf_counter()
+            if self.binary:
+                self.file_handle.buffer.write(b''.join(self.batch))
+            else:
+                self.batch.append('')
+                self.file_handle.write('\n'.join(self.batch))
+            self.batch = []
+            self.batch_size = 0
+            if self.stage_times is not None:
+                self.stage_times['write'] += time.perf_counter() - start_time
+
+    #----------------------------------------
+    def close(self):
+        self.flush()
+
+#=========================
+class sharded_writer():
+    ''' splits the records across several output files by a stable hash of their shard key '''
+
+    #----------------------------------------
+    def __init__(self, file_name, shard_count, *, compression = None, json_library = 'auto', batch_records = 1000, batch_bytes = 1048576): # pylint: disable=too-many-arguments
+        self.file_names = get_shard_file_names(file_name, shard_count)
+        compression = compression or get_compression(file_name)
+        self.output_files = []
+        self.writers = []
+        for shard_file_name in self.file_names:
+            file_handle, binary_handle = open_output_file(shard_file_name, compression)
+            self.output_files.append((file_handle, binary_handle))
+            self.writers.append(record_writer(file_handle, json_library, batch_records, batch_bytes))
+        self.shard_counts = [0] * shard_count
+        self._stage_times = None
+
+    #--set to a dict by run_metrics, passed on to each shard's writer
+    @property
+    def stage_times(self):
+        return self._stage_times
+
+    @stage_times.setter
+    def stage_times(self, stage_times):
+        self._stage_times = stage_times
+        for writer in self.writers:
+            writer.stage_times = stage_times
+
+    #----------------------------------------
+    def get_shard(self, shard_key):
+        #--crc32 rather than hash() so a record lands in the same shard on every run
+        shard = zlib.crc32(shard_key.encode('utf-8')) % len(self.writers)
+        self.shard_counts[shard] += 1
+        return shard
+
+    #----------------------------------------
+    def write(self, json_data):
+        self.writers[self.get_shard(get_shard_key(json_data))].write(json_data)
+
+    #----------------------------------------
+    def write_line(self, output_row, record_id = None, shard_key = None):
+        self.writers[self.get_shard(shard_key or record_id)].write_line(output_row)
+
+    #----------------------------------------
+    def flush(self):
+        for writer in self.writers:
+            writer.flush()
+
+    #----------------------------------------
+    def close(self):
+        for writer, (file_handle, binary_handle) in zip(self.writers, self.output_files):
+            writer.close()
+            close_file(file_handle, binary_handle)
+
+#----------------------------------------
+def get_shard_key(json_data):
+    ''' vessels follow their first owner so an owner and its relationships stay in one shard '''
+    relationships = json_data.get('RELATIONSHIPS')
+    return relationships[0]['REL_POINTER_KEY'] if relationships else json_data['RECORD_ID']
+
+#----------------------------------------
+def get_shard_file_names(file_name, shard_count):
+    ''' numbers the shards ahead of the extensions, spire.json.gz becomes spire_0.json.gz, spire_1.json.gz ... '''
+    directory, base_name = os.path.split(file_name)
+    stem, dot, extensions = base_name.partition('.')
+    number_width = len(str(shard_count - 1))
+    return [os.path.join(directory, '%s_%0*d%s%s' % (stem, number_width, shard, dot, extensions)) for shard in range(shard_count)]
+
+#----------------------------------------
+def get_record_id_hasher(record_id_hash = 'md5'):
+    ''' returns a function that hashes an owner name to its record_id, md5 gives the same ids as compute_record_hash always has '''
+    if record_id_hash == 'md5':
+        return lambda owner_name: hashlib.md5(json.dumps(owner_name).encode('utf-8')).hexdigest()
+    if record_id_hash == 'blake2b':
+        return lambda owner_name: hashlib.blake2b(owner_name.encode('utf-8'), digest_size=16).hexdigest()
+    if record_id_hash == 'xxhash':
+        try:
+            import xxhash # pylint: disable=import-outside-toplevel
+        except ImportError as err:
+            raise ValueError('the xxhash package is not installed, pip install xxhash or use --record_id_hash blake2b') from err
+        return lambda owner_name: xxhash.xxh3_128_hexdigest(owner_name.encode('utf-8'))
+    raise ValueError('unknown record id hash %s' % record_id_hash)
+
+#----------------------------------------
+def get_json_serializer(json_library = 'auto'):
+    ''' returns a function that serializes a record to a json string, auto picks the fastest library installed, msgpack gives bytes '''
+    if json_library == 'msgpack':
+        try:
+            import msgpack # pylint: disable=import-outside-toplevel
+        except ImportError as err:
+            raise ValueError('the msgpack package is not installed, pip install msgpack to write msgpack output') from err
+        return msgpack.Packer(use_bin_type=True).pack
+    if json_library in ('auto', 'orjson'):
+        try:
+            import orjson # pylint: disable=import-outside-toplevel
+            return lambda json_data: orjson.dumps(json_data).decode('utf-8')
+        except ImportError:
+            pass
+    if json_library in ('auto', 'ujson'):
+        try:
+            import ujson # pylint: disable=import-outside-toplevel
+            return functools.partial(ujson.dumps, ensure_ascii=False, escape_forward_slashes=False)
+        except ImportError:
+            pass
+    if json_library not in ('auto', 'json'):
+        raise ValueError('the %s package is not installed' % json_library)
+    return json.dumps
+
+#=========================
+class senzing_sink(abc.ABC):
+    ''' interface for sending records straight to senzing, called from several loader threads at once '''
+
+    #----------------------------------------
+    @abc.abstractmethod
+    def add_record(self, data_source, record_id, json_string):
+        pass
+
+    #----------------------------------------
+    @abc.abstractmethod
+    def delete_record(self, data_source, record_id):
+        pass
+
+    #----------------------------------------
+    def close(self):
+        pass
+
+#=========================
+class g2_engine_sink(senzing_sink):
+    ''' loads records with the senzing G2Engine python sdk '''
+
+    #----------------------------------------
+    def __init__(self, config_json):
+        try:
+            from senzing import G2Engine # pylint: disable=import-outside-toplevel
+        except ImportError:
+            try:
+                from G2Engine import G2Engine # pylint: disable=import-outside-toplevel
+            except ImportError as err:
+                raise ValueError('the senzing python sdk must be on the PYTHONPATH to load directly to senzing') from err
+        if not config_json:
+            raise ValueError('please supply --senzing_config_json or set SENZING_ENGINE_CONFIGURATION_JSON')
+        self.g2_engine = G2Engine()
+        self.g2_engine.init('spire_mapper', config_json, False)
+
+    #----------------------------------------
+    def add_record(self, data_source, record_id, json_string):
+        self.g2_engine.addRecord(data_source, record_id, json_string)
+
+    #----------------------------------------
+    def delete_record(self, data_source, record_id):
+        self.g2_engine.deleteRecord(data_source, record_id)
+
+    #----------------------------------------
+    def close(self):
+        self.g2_engine.destroy()
+
+#=========================
+class stub_sink(senzing_sink):
+    ''' records the calls it receives so loading can be tested without senzing, fail_every forces retries '''
+
+    #----------------------------------------
+    def __init__(self, fail_every = 0):
+        self.calls = []
+        self.call_count = 0
+        import threading # pylint: disable=import-outside-toplevel
+        self.fail_every = fail_every
+        self.lock = threading.Lock()
+
+    #----------------------------------------
+    def record_call(self, call):
+        with self.lock:
+            self.call_count += 1
+            if self.fail_every and self.call_count % self.fail_every == 0:
+                raise RuntimeError('stub failure on call %s' % self.call_count)
+            self.calls.append(call)
+
+    #----------------------------------------
+    def add_record(self, data_source, record_id, json_string):
+        self.record_call(('add_record', data_source, record_id, json_string))
+
+    #----------------------------------------
+    def delete_record(self, data_source, record_id):
+        self.record_call(('delete_record', data_source, record_id))
+
+#=========================
+class senzing_loader(): # pylint: disable=too-many-instance-attributes
+    ''' feeds records to a senzing sink through a bounded queue and a pool of loader threads '''
+
+    #----------------------------------------
+    def __init__(self, sink, data_source, *, json_library = 'auto', thread_count = 4, queue_size = 1000, max_retries = 3, retry_delay = 1.0, error_file_name = None): # pylint: disable=too-many-arguments
+        import threading # pylint: disable=import-outside-toplevel
+        import queue # pylint: disable=import-outside-toplevel
+        self.sink = sink
+        self.data_source = data_source
+        self.serialize = get_json_serializer(json_library)
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.error_file_name = error_file_name
+        self.error_file_handle = None
+        self.lock = threading.Lock()
+        self.loaded_count = 0
+        self.retry_count = 0
+        self.error_count = 0
+
+        #--set when --metrics_interval is used, loading runs in its own threads so it is not timed as a stage
+        self.stage_times = None
+
+        #--the bounded queue blocks the mapper when senzing falls behind
+        self.record_queue = queue.Queue(maxsize=queue_size)
+        self.threads = [threading.Thread(target=self.load_records, daemon=True) for _ in range(thread_count)]
+        for thread in self.threads:
+            thread.start()
 
-        if cat1 not in self.stat_pack:
-            self.stat_pack[cat1] = {}
-        if cat2 not in self.stat_pack[cat1]:
-            self.stat_pack[cat1][cat2] = {}
-            self.stat_pack[cat1][cat2]['count'] = 0
-
-        self.stat_pack[cat1][cat2]['count'] += 1
-        if example:
-            if 'examples' not in self.stat_pack[cat1][cat2]:
-                self.stat_pack[cat1][cat2]['examples'] = []
-            if example not in self.stat_pack[cat1][cat2]['examples']:
-                if len(self.stat_pack[cat1][cat2]['examples']) < 5:
-                    self.stat_pack[cat1][cat2]['examples'].append(example)
+    #----------------------------------------
+    def write(self, json_data):
+        if json_data.get('DSRC_ACTION') == 'D':
+            self.record_queue.put((json_data['RECORD_ID'], self.serialize(json_data), True))
+        else:
+            self.record_queue.put((json_data['RECORD_ID'], self.serialize(json_data), False))
+
+    #----------------------------------------
+    def write_line(self, output_row, record_id = None, shard_key = None):
+        self.record_queue.put((record_id, output_row, False))
+
+    #----------------------------------------
+    def load_records(self):
+        while True:
+            queued_record = self.record_queue.get()
+            if queued_record is None:
+                self.record_queue.task_done()
+                return
+            self.load_record(*queued_record)
+            self.record_queue.task_done()
+
+    #----------------------------------------
+    def load_record(self, record_id, json_string, delete):
+        for attempt in range(self.max_retries + 1):
+            try:
+                if delete:
+                    self.sink.delete_record(self.data_source, record_id)
                 else:
-                    randomSampleI = random.randint(2, 4)
-                    self.stat_pack[cat1][cat2]['examples'][randomSampleI] = example
+                    self.sink.add_record(self.data_source, record_id, json_string)
+            #--any sdk error is retried and then written to the error file rather than killing the thread
+            except Exception as err: # pylint: disable=broad-exception-caught
+                if attempt < self.max_retries:
+                    with self.lock:
+                        self.retry_count += 1
+                    time.sleep(self.retry_delay * 2 ** attempt)
+                    continue
+                self.write_error(json_string, err)
+            else:
+                with self.lock:
+                    self.loaded_count += 1
+            return
 
     #----------------------------------------
-    def capture_mapped_stats(self, json_data):
+    def write_error(self, json_string, err):
+        ''' failed records are written as-is so the error file can be reloaded as a redo file '''
+        with self.lock:
+            self.error_count += 1
+            if self.error_count <= 10:
+                print('load error: %s' % err)
+            if self.error_file_name:
+                if not self.error_file_handle:
+                    self.error_file_handle = open(self.error_file_name, 'w', encoding='utf-8')
+                self.error_file_handle.write(json_string + '\n')
+
+    #----------------------------------------
+    def flush(self):
+        ''' waits for every queued record to be loaded or written to the error file '''
+        self.record_queue.join()
+        with self.lock:
+            if self.error_file_handle:
+                self.error_file_handle.flush()
+
+    #----------------------------------------
+    def close(self):
+        for _ in self.threads:
+            self.record_queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.sink.close()
+        if self.error_file_handle:
+            self.error_file_handle.close()
+
+#----------------------------------------
+def get_senzing_sink(sink_type, config_json = None):
+    if sink_type == 'stub':
+        return stub_sink()
+    return g2_engine_sink(config_json)
+
+#=========================
+class run_metrics():
+    ''' per stage timings and throughput, reported at intervals to stderr and optionally a json lines metrics file '''
 
-        cat1 = json_data.get('RECORD_TYPE', 'UNKNOWN')
+    stages = ('read', 'map', 'stats', 'serialize', 'write')
 
-        for key1 in json_data:
-            if isinstance(json_data[key1], list):
-                self.update_stat(cat1, key1, json_data[key1])
+    #----------------------------------------
+    def __init__(self, interval = 10, metrics_file_name = None):
+        self.stage_times = dict.fromkeys(self.stages, 0.0)
+        self.interval = interval
+        self.metrics_file_name = metrics_file_name
+        self.start_time = time.perf_counter()
+        self.next_report_time = self.start_time + interval
+        self.last_report_time = self.start_time
+        self.last_input_row_count = 0
+        if metrics_file_name:
+            with open(metrics_file_name, 'w'):
+                pass
+
+    #----------------------------------------
+    def add_times(self, stage_times):
+        for stage, stage_time in stage_times.items():
+            self.stage_times[stage] += stage_time
+
+    #----------------------------------------
+    def timed_rows(self, input_rows):
+        ''' wraps a csv reader to time the reads '''
+        input_rows = iter(input_rows)
+        while True:
+            start_time = time.perf_counter()
+            input_row = next(input_rows, None)
+            self.stage_times['read'] += time.perf_counter() - start_time
+            if input_row is None:
+                return
+            yield input_row
+
+    #----------------------------------------
+    def report_if_due(self, input_row_count, output_row_count):
+        if time.perf_counter() >= self.next_report_time:
+            self.report(input_row_count, output_row_count)
+
+    #----------------------------------------
+    def report(self, input_row_count, output_row_count, final = False):
+        report_time = time.perf_counter()
+        elapsed_seconds = max(report_time - self.start_time, 0.000001)
+        interval_seconds = max(report_time - self.last_report_time, 0.000001)
+
+        #--stats are captured inside map(), so take them out of its time
+        stage_times = dict(self.stage_times)
+        stage_times['map'] = max(stage_times['map'] - stage_times['stats'], 0.0)
+        total_stage_time = sum(stage_times.values()) or 1.0
+
+        metrics = {'final': final,
+                   'elapsed_seconds': round(elapsed_seconds, 2),
+                   'input_rows': input_row_count,
+                   'output_rows': output_row_count,
+                   'rows_per_sec': round(input_row_count / elapsed_seconds),
+                   'interval_rows_per_sec': round((input_row_count - self.last_input_row_count) / interval_seconds),
+                   'stage_seconds': {stage: round(stage_time, 3) for stage, stage_time in stage_times.items()},
+                   'stage_pct': {stage: round(stage_time / total_stage_time * 100, 1) for stage, stage_time in stage_times.items()}}
+
+        print('%s rows, %s rows/sec (%s rows/sec last interval), %s' % (input_row_count,
+                                                                        metrics['rows_per_sec'],
+                                                                        metrics['interval_rows_per_sec'],
+                                                                        ', '.join('%s %s%%' % (stage, pct) for stage, pct in metrics['stage_pct'].items())), file=sys.stderr)
+        if self.metrics_file_name:
+            with open(self.metrics_file_name, 'a') as metrics_file:
+                metrics_file.write(json.dumps(metrics) + '\n')
+
+        self.last_report_time = report_time
+        self.last_input_row_count = input_row_count
+        self.next_report_time = report_time + self.interval
+
+#=========================
+class offset_line_reader():
+    ''' yields the decoded lines of a binary stream while tracking the byte offset of the next line '''
+
+    #----------------------------------------
+    def __init__(self, binary_handle):
+        self.binary_handle = binary_handle
+        self.offset = 0
+
+    #----------------------------------------
+    def __iter__(self):
+        readline = self.binary_handle.readline
+        while True:
+            line = readline()
+            if not line:
+                return
+            self.offset += len(line)
+            yield line.decode('utf-8')
+
+    #----------------------------------------
+    def skip_to(self, offset):
+        ''' moves to a row boundary saved by a checkpoint, streams that cannot seek are read past '''
+        if self.binary_handle.seekable():
+            self.binary_handle.seek(offset)
+        else:
+            while self.offset < offset:
+                skipped_bytes = self.binary_handle.read(min(1048576, offset - self.offset))
+                if not skipped_bytes:
+                    raise ValueError('the input ends before the checkpoint offset %s' % offset)
+                self.offset += len(skipped_bytes)
+        self.offset = offset
+
+    #----------------------------------------
+    def snap_to(self, offset):
+        ''' moves to the first line starting at or after offset, a line break inside a quoted value looks like a row boundary here '''
+        if offset > self.offset:
+            self.skip_to(offset - 1)
+            self.offset += len(self.binary_handle.readline())
+
+#=========================
+class row_filter():
+    ''' drops input rows on column values before they are mapped, counting them by column under !FILTERED '''
+
+    #----------------------------------------
+    def __init__(self, include, exclude, mapper):
+        #--column: set of values, a row must have one of the include values and none of the exclude values
+        self.include = include
+        self.exclude = exclude
+        self.mapper = mapper
+        self.columns = list(dict.fromkeys(list(include) + list(exclude)))
+        self.checks = []
+
+    #----------------------------------------
+    def set_header(self, header):
+        ''' resolves the column indexes filter_rows uses from the header '''
+        column_indexes = {column: i for i, column in enumerate(header)}
+        for column in self.columns:
+            if column not in column_indexes:
+                raise ValueError('filter column %s not found in the header' % column)
+        self.checks = [(column, column_indexes[column], values, True) for column, values in self.include.items()]
+        self.checks += [(column, column_indexes[column], values, False) for column, values in self.exclude.items()]
+
+    #----------------------------------------
+    def filter_rows(self, rows):
+        ''' filters csv.reader lists, set_header must be called first '''
+        checks = self.checks
+        for row in rows:
+            for column, column_index, values, keep_values in checks:
+                value = row[column_index] if column_index < len(row) else ''
+                if (value.strip() in values) != keep_values:
+                    self.mapper.stat_pack.add_count('!FILTERED', column, 1)
+                    break
             else:
-                for subrecord in json_data[key1]:
-                    for key2 in subrecord:
-                        self.update_stat(cat1, key2, subrecord[key2])
+                yield row
+
+    #----------------------------------------
+    def filter_batch(self, record_batch):
+        ''' filters a pyarrow record batch with one mask per column, set_header must be called first '''
+        pyarrow = import_pyarrow()
+        for column, _, values, keep_values in self.checks:
+            if not record_batch.num_rows:
+                break
+
+            #--each distinct value is checked once, as the same text the mapper and the csv rows see
+            column_values, column_indices = self.mapper.encode_column(record_batch.column(column))
+            matches = pyarrow.array([value.strip() in values for value in column_values], pyarrow.bool_()).take(column_indices).fill_null('' in values)
+            kept_batch = record_batch.filter(matches if keep_values else pyarrow.compute.invert(matches))
+            if kept_batch.num_rows < record_batch.num_rows:
+                self.mapper.stat_pack.add_count('!FILTERED', column, record_batch.num_rows - kept_batch.num_rows)
+            record_batch = kept_batch
+        return record_batch
+
+#----------------------------------------
+def parse_column_values(column_value_args):
+    ''' turns column=value1,value2 arguments into a dict of column: set of values '''
+    column_values = {}
+    for column_value_arg in column_value_args or []:
+        column, separator, values = column_value_arg.partition('=')
+        if not separator or not column.strip():
+            raise ValueError('%s should look like column=value1,value2' % column_value_arg)
+        column_values.setdefault(column.strip(), set()).update(value.strip() for value in values.split(','))
+    return column_values
+
+#=========================
+class run_checkpoint():
+    ''' periodically saves the input and output offsets and the mapper state so a run can be resumed '''
+
+    #----------------------------------------
+    def __init__(self, checkpoint_file_name, checkpoint_rows, input_reader):
+        self.checkpoint_file_name = checkpoint_file_name
+        self.checkpoint_rows = checkpoint_rows
+        self.input_reader = input_reader
+        self.next_checkpoint_row = checkpoint_rows
+        self.output_writer = None
+        self.output_binary_handle = None
+        self.output_compression = None
+
+    #----------------------------------------
+    def set_output(self, output_writer, output_binary_handle, output_compression):
+        self.output_writer = output_writer
+        self.output_binary_handle = output_binary_handle
+        self.output_compression = output_compression
+
+    #----------------------------------------
+    def load(self):
+        import pickle # pylint: disable=import-outside-toplevel
+        with open(self.checkpoint_file_name, 'rb') as checkpoint_file:
+            state = pickle.load(checkpoint_file)
+        self.next_checkpoint_row = state['input_row_count'] + self.checkpoint_rows
+        return state
+
+    #----------------------------------------
+    def is_due(self, input_row_count):
+        return input_row_count >= self.next_checkpoint_row
+
+    #----------------------------------------
+    def sync_output(self):
+        ''' gets everything written so far onto disk and returns the output offset '''
+        self.output_writer.flush()
+        if self.output_compression:
+            #--compressed output is closed off as a complete stream, the formats all read concatenated streams back as one
+            self.output_writer.file_handle.detach().close()
+        else:
+            self.output_writer.file_handle.flush()
+        self.output_binary_handle.flush()
+        os.fsync(self.output_binary_handle.fileno())
+        output_offset = self.output_binary_handle.tell()
+        if self.output_compression:
+            self.output_writer.file_handle = io.TextIOWrapper(open_compressed(self.output_binary_handle, self.output_compression, 'wb'), encoding='utf-8')
+        return output_offset
+
+    #----------------------------------------
+    def save(self, input_offset, input_row_count, output_row_count, mapper):
+        mapper.capture_cache_stats()
+        state = {'input_offset': input_offset,
+                 'input_row_count': input_row_count,
+                 'output_offset': self.sync_output(),
+                 'output_row_count': output_row_count,
+                 'stat_pack': mapper.stat_pack,
+                 'owner_record_ids': mapper.owner_record_ids}
+        import pickle # pylint: disable=import-outside-toplevel
+        temp_file_name = self.checkpoint_file_name + '.tmp'
+        with open(temp_file_name, 'wb') as checkpoint_file:
+            pickle.dump(state, checkpoint_file, protocol=pickle.HIGHEST_PROTOCOL)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temp_file_name, self.checkpoint_file_name)
+        self.next_checkpoint_row = input_row_count + self.checkpoint_rows
+
+    #----------------------------------------
+    def remove(self):
+        if os.path.exists(self.checkpoint_file_name):
+            os.remove(self.checkpoint_file_name)
+
+#=========================
+class pipeline_reader(io.RawIOBase): # pylint: disable=too-many-instance-attributes
+    ''' reads and decompresses the input ahead in a thread into a bounded queue of blocks so a slow input overlaps with mapping '''
+
+    #----------------------------------------
+    def __init__(self, source_handle, close_source = True, block_size = 1048576, queue_size = 8):
+        import threading # pylint: disable=import-outside-toplevel
+        import queue # pylint: disable=import-outside-toplevel
+        super().__init__()
+        self.source_handle = source_handle
+        self.close_source = close_source
+        self.block_size = block_size
+        self.queue = queue.Queue(queue_size)
+        self.block = b''
+        self.finished = False
+        self.stopping = False
+        self.error = None
+        self.thread = threading.Thread(target=self.read_blocks, daemon=True)
+        self.thread.start()
+
+    #----------------------------------------
+    def readable(self):
+        return True
+
+    #----------------------------------------
+    def read_blocks(self):
+        try:
+            while not self.stopping:
+                block = self.source_handle.read(self.block_size)
+                if not block:
+                    break
+                self.queue.put(block)
+        #--any read error is raised again in the mapping thread when it reaches the end of the queue
+        except Exception as err: # pylint: disable=broad-exception-caught
+            self.error = err
+        self.queue.put(b'')
+
+    #----------------------------------------
+    def readinto(self, buffer):
+        if not self.block:
+            if self.finished:
+                return 0
+            self.block = memoryview(self.queue.get())
+            if not self.block:
+                self.finished = True
+                if self.error:
+                    raise self.error
+                return 0
+        read_size = min(len(buffer), len(self.block))
+        buffer[:read_size] = self.block[:read_size]
+        self.block = self.block[read_size:]
+        return read_size
+
+    #----------------------------------------
+    def close(self):
+        import queue # pylint: disable=import-outside-toplevel
+        if not self.closed:
+            #--an interrupted run stops pulling rows part way, empty the queue so the thread can see it is stopping
+            self.stopping = True
+            while self.thread.is_alive():
+                try:
+                    self.queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            if self.close_source:
+                self.source_handle.close()
+        super().close()
+
+#=========================
+class pipeline_writer():
+    ''' hands records to a thread that serializes and writes them so a slow output overlaps with mapping '''
+
+    #----------------------------------------
+    def __init__(self, writer, batch_records = 1000, queue_size = 8):
+        import threading # pylint: disable=import-outside-toplevel
+        import queue # pylint: disable=import-outside-toplevel
+        self.writer = writer
+        self.batch_records = batch_records
+        self.batch = []
+        self.queue = queue.Queue(queue_size)
+        self.error = None
+        self.thread = threading.Thread(target=self.write_records, daemon=True)
+        self.thread.start()
+
+    #--the checkpoint swaps the file handle of the writer underneath once the queue is flushed
+    @property
+    def file_handle(self):
+        return self.writer.file_handle
+
+    @file_handle.setter
+    def file_handle(self, file_handle):
+        self.writer.file_handle = file_handle
+
+    @property
+    def stage_times(self):
+        return self.writer.stage_times
+
+    @stage_times.setter
+    def stage_times(self, stage_times):
+        self.writer.stage_times = stage_times
+
+    #----------------------------------------
+    def write_records(self):
+        while True:
+            batch = self.queue.get()
+            try:
+                if batch is None:
+                    return
+                if not self.error:
+                    for record in batch:
+                        if isinstance(record, dict):
+                            self.writer.write(record)
+                        else:
+                            self.writer.write_line(*record)
+            #--any write error is raised again in the mapping thread on its next batch
+            except Exception as err: # pylint: disable=broad-exception-caught
+                self.error = err
+            finally:
+                self.queue.task_done()
+
+    #----------------------------------------
+    def write(self, json_data):
+        self.batch.append(json_data)
+        if len(self.batch) >= self.batch_records:
+            self.send_batch()
+
+    #----------------------------------------
+    def write_line(self, output_row, record_id = None, shard_key = None):
+        self.batch.append((output_row, record_id, shard_key))
+        if len(self.batch) >= self.batch_records:
+            self.send_batch()
+
+    #----------------------------------------
+    def send_batch(self):
+        if self.error:
+            raise self.error
+        self.queue.put(self.batch)
+        self.batch = []
+
+    #----------------------------------------
+    def flush(self):
+        ''' waits for everything queued to be written '''
+        if self.batch:
+            self.send_batch()
+        self.queue.join()
+        if self.error:
+            raise self.error
+        self.writer.flush()
+
+    #----------------------------------------
+    def close(self):
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+        self.writer.close()
+
+#----------------------------------------
+def init_worker(mapper_args, worker_options):
+    global worker_mapper, worker_stats_seed, worker_content_hash, worker_serialize, worker_stage_times, worker_record_batches
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker_mapper = mapper(**mapper_args)
+    worker_mapper.capture_stats = worker_options['capture_stats']
+    worker_serialize = get_json_serializer(worker_options['json_library'])
+    if worker_options['header']:
+        worker_mapper.set_header(worker_options['header'])
+    worker_stats_seed = worker_options['stats_seed']
+    worker_content_hash = worker_options['compute_content_hash']
+    worker_stage_times = worker_options['collect_stage_times']
+    worker_record_batches = worker_options['record_batches']
+
+    #--owners are deduped again across workers by the parent, so it captures their stats
+    worker_mapper.capture_owner_stats = False
+
+#----------------------------------------
+def map_chunk(first_row_num, row_chunk):
+    ''' maps a chunk of input rows, or a pyarrow record batch, in a worker process '''
+    #--seed each chunk from its first row so seeded runs are repeatable
+    worker_mapper.stat_pack = mapping_stats(None if worker_stats_seed is None else worker_stats_seed + first_row_num, bounded=worker_mapper.stat_pack.bounded)
+    stage_times = dict.fromkeys(('map', 'stats', 'serialize'), 0.0)
+    worker_mapper.stage_times = stage_times if worker_stage_times else None
+
+    start_time = time.perf_counter()
+    output_rows = []
+    if worker_record_batches:
+        json_list = worker_mapper.map_batch(row_chunk, first_row_num)
+    else:
+        json_list = worker_mapper.map_rows(row_chunk, first_row_num)
+
+    #--the stats still buffered go back with this chunk, count them as part of its stats time
+    stats_time = time.perf_counter()
+    worker_mapper.stat_pack.flush()
+    map_time = time.perf_counter()
+    stage_times['stats'] += map_time - stats_time
+
+    for json_data in json_list:
+        content_hash = worker_mapper.compute_record_hash(json_data) if worker_content_hash else None
+        owner_data = json_data if json_data['RECORD_TYPE'] == 'ORGANIZATION' else None
+        output_rows.append((json_data['RECORD_ID'], json_data['RECORD_TYPE'], content_hash, worker_serialize(json_data), owner_data, get_shard_key(json_data)))
+    stage_times['map'] += map_time - start_time
+    stage_times['serialize'] += time.perf_counter() - map_time
+    worker_mapper.capture_cache_stats()
+    return len(row_chunk), output_rows, worker_mapper.stat_pack, stage_times
+
+#----------------------------------------
+def get_part_range(part, file_size):
+    ''' turns a K/N part like 2/8 into the byte range of that part of the file '''
+    try:
+        part_number, part_count = [int(value) for value in part.split('/')]
+    except ValueError as err:
+        raise ValueError('--part should look like 2/8, the second of eight parts') from err
+    if not 1 <= part_number <= part_count:
+        raise ValueError('--part %s is not between 1 and %s' % (part_number, part_count))
+    return file_size * (part_number - 1) // part_count, file_size * part_number // part_count
+
+#----------------------------------------
+def read_rows_before(csv_reader, input_reader, end_offset):
+    ''' yields the csv rows that start before end_offset, a row running past it is still read whole '''
+    while input_reader.offset < end_offset:
+        row = next(csv_reader, None)
+        if row is None:
+            return
+        yield row
+
+#----------------------------------------
+def read_row_batches(input_rows, batch_size):
+    ''' groups the rows from a csv reader into lists of up to batch_size rows '''
+    while True:
+        row_batch = list(itertools.islice(input_rows, batch_size))
+        if not row_batch:
+            return
+        yield row_batch
+
+#----------------------------------------
+def map_parallel(input_rows, output_writer, stats_mapper, workers, chunk_size, *, ordered_output = True, stats_seed = None, delta = None, header = None, json_library = 'auto', metrics = None, checkpoint = None, input_row_count = 0, output_row_count = 0, record_batches = False): # pylint: disable=too-many-arguments
+    ''' maps the input rows, or pyarrow record batches of up to chunk_size rows, across a pool of worker processes '''
+    import concurrent.futures # pylint: disable=import-outside-toplevel
+
+    next_progress = (input_row_count // 1000 + 1) * 1000
+
+    #--only keep a couple of chunks per worker in flight so memory stays bounded
+    max_pending = workers * 2
+    pending = collections.deque()
+
+    def write_result(future, input_offset):
+        nonlocal input_row_count, output_row_count, next_progress
+        chunk_row_count, output_rows, stat_pack, stage_times = future.result()
+        input_row_count += chunk_row_count
+        if metrics:
+            metrics.add_times(stage_times)
+        stats_mapper.stat_pack.merge(stat_pack)
+        for record_id, record_type, content_hash, output_row, owner_data, shard_key in output_rows:
+            if owner_data:
+                if not stats_mapper.is_new_owner(record_id):
+                    continue
+                if stats_mapper.capture_owner_stats:
+                    stats_mapper.capture_mapped_stats(owner_data)
+            if delta and delta.check(record_id, record_type, content_hash) == 'UNCHANGED':
+                continue
+            output_writer.write_line(output_row, record_id, shard_key)
+            output_row_count += 1
+        if input_row_count >= next_progress:
+            print('%s rows processed, %s rows written' % (input_row_count, output_row_count))
+            next_progress = (input_row_count // 1000 + 1) * 1000
+        if metrics:
+            metrics.report_if_due(input_row_count, output_row_count)
+
+        #--results are written in input order, so everything before this chunk's end offset is done
+        if checkpoint and checkpoint.is_due(input_row_count):
+            checkpoint.save(input_offset, input_row_count, output_row_count, stats_mapper)
+
+    def wait_for_results(wait_for_all):
+        if ordered_output:
+            while pending and (wait_for_all or len(pending) >= max_pending):
+                write_result(*pending.popleft())
+        else:
+            while pending and (wait_for_all or len(pending) >= max_pending):
+                done, _ = concurrent.futures.wait([future for future, input_offset in pending], return_when=concurrent.futures.FIRST_COMPLETED)
+                for future, input_offset in list(pending):
+                    if future in done:
+                        pending.remove((future, input_offset))
+                        write_result(future, None)
+
+    mapper_args = {'dedupe_owners': stats_mapper.dedupe_owners, 'mapping_file': stats_mapper.mapping_file, 'record_id_hash': stats_mapper.record_id_hash, 'bounded_stats': stats_mapper.stat_pack.bounded, 'columns': stats_mapper.columns, 'payload': stats_mapper.payload, 'typed_values': stats_mapper.typed_values}
+    worker_options = {'stats_seed': stats_seed, 'capture_stats': stats_mapper.capture_stats, 'compute_content_hash': bool(delta), 'header': header, 'json_library': json_library, 'collect_stage_times': bool(metrics), 'record_batches': record_batches}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(mapper_args, worker_options)) as executor:
+        first_row_num = input_row_count + 1
+        for row_chunk in input_rows if record_batches else read_row_batches(input_rows, chunk_size):
+            input_offset = checkpoint.input_reader.offset if checkpoint else None
+            pending.append((executor.submit(map_chunk, first_row_num, row_chunk), input_offset))
+            first_row_num += len(row_chunk)
+            wait_for_results(False)
+            if shut_down:
+                break
+        wait_for_results(True)
+
+    return input_row_count, output_row_count
+
+#----------------------------------------
+def get_compression(file_name, binary_handle = None):
+    ''' determines the compression from the file extension or the leading magic bytes '''
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension in compression_extensions:
+        return compression_extensions[extension]
+    if binary_handle:
+        leading_bytes = binary_handle.peek(8)[:8]
+        for magic_bytes, compression in compression_magic:
+            if leading_bytes.startswith(magic_bytes):
+                return compression
+    return None
+
+#----------------------------------------
+def import_zstandard():
+    ''' zstandard is only needed for zstd files, so it is imported on first use '''
+    try:
+        import zstandard # pylint: disable=import-outside-toplevel
+    except ImportError as err:
+        raise ValueError('the zstandard package must be installed to read or write zstd files') from err
+    return zstandard
+
+#----------------------------------------
+def check_compression(compression):
+    if compression == 'zstd':
+        import_zstandard()
+
+#----------------------------------------
+def open_compressed(binary_handle, compression, mode):
+    ''' wraps a binary file handle in a streaming (de)compressor '''
+    if compression == 'gzip':
+        import gzip # pylint: disable=import-outside-toplevel
+        return gzip.GzipFile(fileobj=binary_handle, mode=mode, compresslevel=6)
+    if compression == 'bz2':
+        import bz2 # pylint: disable=import-outside-toplevel
+        return bz2.BZ2File(binary_handle, mode=mode)
+    if compression == 'xz':
+        import lzma # pylint: disable=import-outside-toplevel
+        return lzma.LZMAFile(binary_handle, mode=mode)
+    if compression == 'zstd':
+        zstandard = import_zstandard()
+        if mode == 'rb':
+            return zstandard.ZstdDecompressor().stream_reader(binary_handle, closefd=False)
+        return zstandard.ZstdCompressor().stream_writer(binary_handle, closefd=False)
+    return binary_handle
+
+#----------------------------------------
+def open_input_file(file_name, pipeline = False, queue_size = 8):
+    ''' opens a plain or compressed input file for streaming, - for stdin, pipeline reads ahead in a thread '''
+    binary_handle = sys.__stdin__.buffer if file_name == '-' else open(file_name, 'rb')
+    compressed_handle = open_compressed(binary_handle, get_compression(file_name, binary_handle), 'rb')
+    if pipeline:
+        compressed_handle = io.BufferedReader(pipeline_reader(compressed_handle, compressed_handle is not binary_handle, queue_size=queue_size))
+    return io.TextIOWrapper(compressed_handle, encoding='utf-8', newline=''), binary_handle
+
+#----------------------------------------
+def get_input_format(file_name):
+    ''' parquet and arrow ipc files are recognized by their extension, anything else is read as csv '''
+    return input_format_extensions.get(os.path.splitext(file_name)[1].lower(), 'csv')
+
+#----------------------------------------
+def import_pyarrow():
+    ''' pyarrow is only needed for parquet and arrow input, so it is imported on first use '''
+    try:
+        import pyarrow # pylint: disable=import-outside-toplevel
+        import pyarrow.compute # pylint: disable=import-outside-toplevel
+        import pyarrow.ipc # pylint: disable=import-outside-toplevel
+        import pyarrow.parquet # pylint: disable=import-outside-toplevel
+    except ImportError as err:
+        raise ValueError('the pyarrow package is not installed, pip install pyarrow to read parquet or arrow files') from err
+    return pyarrow
+
+#----------------------------------------
+def open_arrow_input(file_name, input_format, columns, batch_size = 10000):
+    ''' returns the columns present in a parquet or arrow ipc file and an iterator of record batches of just those, - for an arrow stream on stdin '''
+    pyarrow = import_pyarrow()
+    if input_format == 'parquet':
+        if file_name == '-':
+            raise ValueError('parquet cannot be read from stdin, send an arrow stream instead')
+        parquet_file = pyarrow.parquet.ParquetFile(file_name)
+        header = [column for column in columns if column in parquet_file.schema_arrow.names]
+        return header, parquet_file.iter_batches(batch_size=batch_size, columns=header)
+
+    if file_name == '-':
+        record_batches = pyarrow.ipc.open_stream(sys.__stdin__.buffer)
+        schema = record_batches.schema
+    else:
+        try:
+            reader = pyarrow.ipc.open_file(file_name)
+            record_batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        except pyarrow.ArrowInvalid:
+            reader = record_batches = pyarrow.ipc.open_stream(file_name)
+        schema = reader.schema
+    header = [column for column in columns if column in schema.names]
+    return header, (record_batch.select(header) for record_batch in record_batches)
+
+#----------------------------------------
+def open_output_file(file_name, compression = None, resume_offset = None):
+    ''' opens a plain or compressed output file for streaming, - for stdout, resume_offset truncates and appends '''
+    compression = compression or get_compression(file_name)
+    check_compression(compression)
+    if file_name == '-':
+        binary_handle = sys.__stdout__.buffer
+    elif resume_offset is not None:
+        binary_handle = open(file_name, 'r+b')
+        binary_handle.truncate(resume_offset)
+        binary_handle.seek(resume_offset)
+    else:
+        binary_handle = open(file_name, 'wb')
+    compressed_handle = open_compressed(binary_handle, compression, 'wb')
+    return io.TextIOWrapper(compressed_handle, encoding='utf-8'), binary_handle
+
+#----------------------------------------
+def close_file(file_handle, binary_handle):
+    ''' closes a file from open_input_file or open_output_file, leaving stdin and stdout open '''
+    if binary_handle in (sys.__stdin__.buffer, sys.__stdout__.buffer):
+        compressed_handle = file_handle.detach()
+        if compressed_handle is not binary_handle:
+            compressed_handle.close()
+        binary_handle.flush()
+    else:
+        file_handle.close()
+        binary_handle.close()
 
 #----------------------------------------
 def signal_handler(signal, frame):
@@ -580,56 +2539,405 @@ def signal_handler(signal, frame):
 
 #----------------------------------------
 if __name__ == "__main__":
+    import argparse
+
     proc_start_time = time.time()
-    shut_down = False
     signal.signal(signal.SIGINT, signal_handler)
 
     input_file = 'enhanced_vessel_information.csv'
     csv_dialect = 'excel'
 
     parser = argparse.ArgumentParser()
-    parser.add_argument('-i', '--input_file', dest='input_file', default = input_file, help='the name of the input file')
-    parser.add_argument('-o', '--output_file', dest='output_file', help='the name of the output file')
+    parser.add_argument('-i', '--input_file', dest='input_file', default = input_file, help='the name of the input file, may be compressed, - for stdin')
+    parser.add_argument('--input_format', dest='input_format', choices=['csv', 'parquet', 'arrow'], help='csv, parquet or arrow ipc, defaults to the file extension (.parquet, .arrow, .feather) or csv, parquet and arrow need pyarrow')
+    parser.add_argument('-o', '--output_file', dest='output_file', help='the name of the output file, compressed by extension (.gz, .bz2, .xz, .zst), - for stdout')
+    parser.add_argument('--output_compression', dest='output_compression', choices=['gzip', 'bz2', 'xz', 'zstd'], help='compress the output regardless of its extension, useful with -o -')
+    parser.add_argument('--json_library', dest='json_library', choices=['auto', 'orjson', 'ujson', 'json'], default='auto', help='json library used to write the output, auto uses orjson or ujson when installed')
+    parser.add_argument('--output_encoding', dest='output_encoding', choices=['json', 'msgpack'], default='json', help='json lines, or a stream of msgpack maps which is smaller and faster to read back, msgpack needs pip install msgpack')
+    parser.add_argument('--typed_values', dest='typed_values', action='store_true', default=False, help='write the numeric and boolean columns like dwt, loa and ice_classed as numbers and booleans instead of strings')
+    parser.add_argument('--shards', dest='shards', type=int, default=1, help='split the output across this many files named like output_0.json, records for one owner stay in one file')
+    parser.add_argument('--write_batch_records', dest='write_batch_records', type=int, default=1000, help='records buffered before each write, defaults to 1000')
+    parser.add_argument('--write_batch_bytes', dest='write_batch_bytes', type=int, default=1048576, help='bytes buffered before each write, defaults to 1048576')
+    parser.add_argument('-m', '--mapping_file', dest='mapping_file', help='optional json file of column: attribute mappings that override or extend the built in ones')
     parser.add_argument('-l', '--log_file', dest='log_file', help='optional name of the statistics log file')
+    parser.add_argument('--stats_seed', dest='stats_seed', type=int, help='optional random seed for the examples in the statistics log file')
+    parser.add_argument('--bounded_stats', dest='bounded_stats', action='store_true', default=False, help='keep the -l stats in a fixed amount of memory with approximate unique counts, also reports the top 5 values of each attribute')
+    parser.add_argument('--all_owner_records', dest='all_owner_records', action='store_true', default=False, help='write an owner record for every vessel rather than once per owner')
+    parser.add_argument('--delta_state', dest='delta_state', help='optional state file for incremental runs, only new and changed records are written and deletes are written for records no longer present')
+    parser.add_argument('--previous_output', dest='previous_output', help='with --delta_state, build the previous state from this full output file instead of the state file')
+    parser.add_argument('--record_id_hash', dest='record_id_hash', choices=['md5', 'blake2b', 'xxhash'], default='md5', help='hash used for the owner record_ids, md5 keeps the ids of earlier runs, blake2b and xxhash are faster but give new ids')
+    parser.add_argument('--fast_csv', dest='fast_csv', action='store_true', default=False, help='read rows with csv.reader and pre-resolved column indexes instead of csv.DictReader')
+    parser.add_argument('--filter', dest='filter', action='append', metavar='COLUMN=VALUES', help='only map rows where the column is one of these comma separated values, like trading_status=Existing,NewBuilding, may be repeated')
+    parser.add_argument('--exclude', dest='exclude', action='append', metavar='COLUMN=VALUES', help='skip rows where the column is one of these comma separated values, like trading_status=Scrapped,TotalLoss, may be repeated')
+    parser.add_argument('--columns', dest='columns', nargs='+', help='only map these columns, the imo and owner columns are always mapped')
+    parser.add_argument('--no_payload', dest='no_payload', action='store_true', default=False, help='only map the columns that go to senzing attributes, skipping the payload columns')
+    parser.add_argument('--load_to', dest='load_to', choices=['senzing', 'stub'], help='load the records straight into senzing instead of writing an output file, stub only records the calls for testing')
+    parser.add_argument('--senzing_config_json', dest='senzing_config_json', default=os.getenv('SENZING_ENGINE_CONFIGURATION_JSON'), help='senzing engine configuration, defaults to the SENZING_ENGINE_CONFIGURATION_JSON environment variable')
+    parser.add_argument('--loader_threads', dest='loader_threads', type=int, default=4, help='threads loading records into senzing, defaults to 4')
+    parser.add_argument('--load_queue_size', dest='load_queue_size', type=int, default=1000, help='mapped records waiting to be loaded before mapping pauses, defaults to 1000')
+    parser.add_argument('--load_retries', dest='load_retries', type=int, default=3, help='times a failed record is retried before it goes to the error file, defaults to 3')
+    parser.add_argument('--load_error_file', dest='load_error_file', default='spire_load_errors.json', help='file for the records that could not be loaded, can be reloaded as a redo file')
+    parser.add_argument('--metrics_interval', dest='metrics_interval', type=float, default=0, help='report rows/sec and the time share of each stage to stderr every this many seconds')
+    parser.add_argument('--metrics_file', dest='metrics_file', help='optional json lines file for the interval metrics, defaults the interval to 10 seconds')
+    parser.add_argument('--profile', dest='profile_file', help='optional file for a cProfile dump of the run, read it with pstats')
+    parser.add_argument('--checkpoint_file', dest='checkpoint_file', help='optional file to save progress to every --checkpoint_rows rows and on interrupt so the run can be resumed')
+    parser.add_argument('--checkpoint_rows', dest='checkpoint_rows', type=int, default=100000, help='input rows between checkpoints, defaults to 100000')
+    parser.add_argument('--resume', dest='resume', action='store_true', default=False, help='continue an interrupted run from its --checkpoint_file, appending to the output file')
+    parser.add_argument('--pipeline', dest='pipeline', action='store_true', default=False, help='read and write in their own threads so a slow input or output does not hold up the mapping')
+    parser.add_argument('--pipeline_queue_size', dest='pipeline_queue_size', type=int, default=8, help='with --pipeline, 1MB input blocks or batches of --write_batch_records records queued between stages, defaults to 8')
+    parser.add_argument('--part', dest='part', help='only map part K of N of the input, like 2/8, split on row boundaries, merge the parts with spire_reduce.py')
+    parser.add_argument('--start_offset', dest='start_offset', type=int, help='only map the rows starting at or after this byte offset of the input')
+    parser.add_argument('--end_offset', dest='end_offset', type=int, help='only map the rows starting before this byte offset of the input')
+    parser.add_argument('--part_stats_file', dest='part_stats_file', help='with a part or byte range, save its statistics to this file for spire_reduce.py')
+    parser.add_argument('-w', '--workers', dest='workers', type=int, default=1, help='number of mapping processes to use, defaults to 1')
+    parser.add_argument('--chunk_size', dest='chunk_size', type=int, default=1000, help='rows sent to a worker at a time when --workers is greater than 1')
+    parser.add_argument('--unordered_output', dest='unordered_output', action='store_true', default=False, help='with --workers, write records as they complete instead of in input order')
     args = parser.parse_args()
 
-    if not args.input_file or not os.path.exists(args.input_file):
+    if not args.input_file or (args.input_file != '-' and not os.path.exists(args.input_file)):
         print('\nPlease supply a valid input file name on the command line\n')
         sys.exit(1)
-    if not args.output_file:
+    if not args.output_file and not args.load_to:
         print('\nPlease supply a valid output file name on the command line\n')
         sys.exit(1)
+    if args.output_file and args.load_to:
+        print('\nPlease supply either an output file or --load_to, not both\n')
+        sys.exit(1)
+    if args.previous_output and not args.delta_state:
+        print('\nPlease also supply a --delta_state file to use --previous_output\n')
+        sys.exit(1)
+    try:
+        get_record_id_hasher(args.record_id_hash)
+        if args.output_encoding == 'msgpack':
+            get_json_serializer('msgpack')
+    except ValueError as err:
+        print('\n%s\n' % err)
+        sys.exit(1)
+    if args.output_encoding == 'msgpack' and (args.load_to or args.previous_output):
+        print('\nMsgpack output cannot be combined with --load_to or --previous_output, they only take json\n')
+        sys.exit(1)
+    try:
+        filter_include = parse_column_values(args.filter)
+        filter_exclude = parse_column_values(args.exclude)
+    except ValueError as err:
+        print('\n%s\n' % err)
+        sys.exit(1)
+    input_format = args.input_format or get_input_format(args.input_file)
+    if input_format != 'csv' and (args.checkpoint_file or args.pipeline):
+        print('\nCheckpoints and --pipeline are only supported for csv input\n')
+        sys.exit(1)
+    if input_format != 'csv':
+        try:
+            import_pyarrow()
+        except ValueError as err:
+            print('\n%s\n' % err)
+            sys.exit(1)
+    byte_range = None
+    if args.part or args.start_offset is not None or args.end_offset is not None:
+        if args.part and (args.start_offset is not None or args.end_offset is not None):
+            print('\nPlease supply either --part or --start_offset and --end_offset\n')
+            sys.exit(1)
+        if input_format != 'csv' or args.input_file == '-' or args.delta_state:
+            print('\nParts and byte ranges need a csv input file and cannot be combined with --delta_state\n')
+            sys.exit(1)
+        with open(args.input_file, 'rb') as input_binary_handle:
+            if get_compression(args.input_file, input_binary_handle):
+                print('\nParts and byte ranges need an uncompressed input file\n')
+                sys.exit(1)
+        input_file_size = os.path.getsize(args.input_file)
+        try:
+            byte_range = get_part_range(args.part, input_file_size) if args.part else (args.start_offset or 0, input_file_size if args.end_offset is None else args.end_offset)
+        except ValueError as err:
+            print('\n%s\n' % err)
+            sys.exit(1)
+    if byte_range and args.output_encoding == 'msgpack':
+        print('\nParts and byte ranges are merged by spire_reduce.py as json lines, so they cannot be written as msgpack\n')
+        sys.exit(1)
+    if args.part_stats_file and not byte_range:
+        print('\nA --part_stats_file is only written for a --part or byte range\n')
+        sys.exit(1)
+    if args.resume and not (args.checkpoint_file and os.path.exists(args.checkpoint_file)):
+        print('\nPlease supply the --checkpoint_file of the run to resume\n')
+        sys.exit(1)
+    if args.checkpoint_file and (args.output_file in (None, '-') or args.delta_state or args.unordered_output):
+        print('\nCheckpoints need an output file and cannot be combined with --delta_state or --unordered_output\n')
+        sys.exit(1)
+    if args.shards > 1 and (args.output_file in (None, '-') or args.checkpoint_file):
+        print('\nShards need an output file name and cannot be combined with --checkpoint_file\n')
+        sys.exit(1)
+    if min(args.workers, args.chunk_size, args.write_batch_records, args.checkpoint_rows, args.shards, args.pipeline_queue_size) < 1:
+        print('\nWorkers, chunk size, write batch records, checkpoint rows, shards and pipeline queue size must be at least 1\n')
+        sys.exit(1)
 
-    input_file_handle = open(args.input_file, 'r')
-    output_file_handle = open(args.output_file, 'w', encoding='utf-8')
-    mapper = mapper()
-
-    input_row_count = 0
-    output_row_count = 0
-    for input_row in csv.DictReader(input_file_handle, dialect=csv_dialect):
-        input_row_count += 1
-
-        json_list = mapper.map(input_row, input_row_count)
-        for json_data in json_list:
-            output_file_handle.write(json.dumps(json_data) + '\n')
-            output_row_count += 1
-
-        if input_row_count % 1000 == 0:
-            print('%s rows processed, %s rows written' % (input_row_count, output_row_count))
+    #--keep progress messages out of the records when writing to stdout
+    if args.output_file == '-':
+        sys.stdout = sys.stderr
+
+    #--msgpack goes through the same writers and workers as json, in place of the json library
+    record_encoding = 'msgpack' if args.output_encoding == 'msgpack' else args.json_library
+
+    checkpoint = None
+    resume_state = None
+    if args.checkpoint_file:
+        checkpoint = run_checkpoint(args.checkpoint_file, args.checkpoint_rows, None)
+        if args.resume:
+            resume_state = checkpoint.load()
+
+    try:
+        input_file_handle = None
+        input_binary_handle = None
+        output_binary_handle = None
+        if input_format == 'csv':
+            input_file_handle, input_binary_handle = open_input_file(args.input_file, args.pipeline, args.pipeline_queue_size)
+        if args.load_to:
+            output_file_handle = None
+            output_writer = senzing_loader(get_senzing_sink(args.load_to, args.senzing_config_json),
+                                           'SPIRE',
+                                           json_library=args.json_library,
+                                           thread_count=args.loader_threads,
+                                           queue_size=args.load_queue_size,
+                                           max_retries=args.load_retries,
+                                           error_file_name=args.load_error_file)
+        elif args.shards > 1:
+            output_file_handle = None
+            output_writer = sharded_writer(args.output_file, args.shards, compression=args.output_compression, json_library=record_encoding, batch_records=args.write_batch_records, batch_bytes=args.write_batch_bytes)
+        else:
+            output_file_handle, output_binary_handle = open_output_file(args.output_file, args.output_compression, resume_state['output_offset'] if resume_state else None)
+            output_writer = record_writer(output_file_handle, record_encoding, args.write_batch_records, args.write_batch_bytes)
+    except ValueError as err:
+        print('\n%s\n' % err)
+        sys.exit(1)
+    if args.mapping_file and not os.path.exists(args.mapping_file):
+        print('\nMapping file %s not found\n' % args.mapping_file)
+        sys.exit(1)
+    try:
+        spire_mapper_instance = mapper(dedupe_owners=not args.all_owner_records,
+                                       stats_seed=args.stats_seed,
+                                       mapping_file=args.mapping_file,
+                                       record_id_hash=args.record_id_hash,
+                                       bounded_stats=args.bounded_stats,
+                                       columns=args.columns,
+                                       payload=not args.no_payload,
+                                       typed_values=args.typed_values)
+    except ValueError as err:
+        print('\n%s\n' % err)
+        sys.exit(1)
+    spire_mapper_instance.capture_stats = bool(args.log_file or args.part_stats_file)
+
+    #--owners repeated across parts are only known to the reduce, so it captures their stats
+    if byte_range:
+        spire_mapper_instance.capture_owner_stats = False
+    if resume_state:
+        spire_mapper_instance.stat_pack = resume_state['stat_pack']
+        spire_mapper_instance.owner_record_ids = resume_state['owner_record_ids']
+    delta = None
+    if args.delta_state:
+        try:
+            delta = delta_state(args.delta_state, args.previous_output)
+        except ValueError as err:
+            print('\n%s\n' % err)
+            sys.exit(1)
+
+    #--filters are applied as the rows are read, before a dict is built or anything is mapped
+    input_filter = None
+    if filter_include or filter_exclude:
+        input_filter = row_filter(filter_include, filter_exclude, spire_mapper_instance)
+
+    #--columnar files are mapped a record batch at a time, the workers get a batch of --chunk_size rows each
+    record_batches = input_format != 'csv'
+    if record_batches:
+        try:
+            input_columns = list(dict.fromkeys(spire_mapper_instance.input_columns + (input_filter.columns if input_filter else [])))
+            header, input_rows = open_arrow_input(args.input_file, input_format, input_columns, args.chunk_size if args.workers > 1 else 10000)
+            spire_mapper_instance.check_header(set(header))
+            if input_filter:
+                input_filter.set_header(header)
+                input_rows = (input_filter.filter_batch(record_batch) for record_batch in input_rows)
+        except ValueError as err:
+            print('\n%s\n' % err)
+            sys.exit(1)
+        map_function = spire_mapper_instance.map_batch
+        header = None
+    else:
+        #--checkpoints read the input through a line reader that knows the byte offset of each row
+        #--byte ranges read through the same reader to know where each row starts
+        input_lines = input_file_handle
+        input_reader = None
+        if checkpoint or byte_range:
+            input_reader = offset_line_reader(input_file_handle.buffer)
+            input_lines = iter(input_reader)
+        if checkpoint:
+            checkpoint.input_reader = input_reader
+            checkpoint.set_output(output_writer, output_binary_handle, args.output_compression or get_compression(args.output_file))
+
+        csv_reader = csv.reader(input_lines, dialect=csv_dialect)
+        header = next(csv_reader, [])
+        if resume_state:
+            try:
+                checkpoint.input_reader.skip_to(resume_state['input_offset'])
+            except ValueError as err:
+                print('\n%s\n' % err)
+                sys.exit(1)
+            print('Resuming after row %s' % resume_state['input_row_count'])
+        elif byte_range:
+            input_reader.snap_to(byte_range[0])
+
+        #--the fast reader maps csv.reader lists by column index so no dict is built per row, filters and projection use it too
+        if args.fast_csv or input_filter or args.columns or args.no_payload or byte_range:
+            input_rows = csv_reader
+            if byte_range:
+                input_rows = read_rows_before(csv_reader, input_reader, byte_range[1])
+            try:
+                spire_mapper_instance.set_header(header)
+                if input_filter:
+                    input_filter.set_header(header)
+                    input_rows = input_filter.filter_rows(input_rows)
+            except ValueError as err:
+                print('\n%s\n' % err)
+                sys.exit(1)
+            map_function = spire_mapper_instance.map_row
+        else:
+            try:
+                spire_mapper_instance.check_header(set(header))
+            except ValueError as err:
+                print('\n%s\n' % err)
+                sys.exit(1)
+            input_rows = csv.DictReader(input_lines, fieldnames=header, dialect=csv_dialect)
+            map_function = spire_mapper_instance.map
+            header = None
+
+    #--the pipeline reads and writes in their own threads, an interrupt stops the mapping at a row like any other run
+    if args.pipeline:
+        output_writer = pipeline_writer(output_writer, args.write_batch_records, args.pipeline_queue_size)
+        if checkpoint:
+            checkpoint.output_writer = output_writer
+
+    #--instrumentation is only wired in when asked for so normal runs pay nothing for it
+    metrics = None
+    if args.metrics_interval or args.metrics_file:
+        metrics = run_metrics(args.metrics_interval or 10, args.metrics_file)
+        input_rows = metrics.timed_rows(input_rows)
+        spire_mapper_instance.stage_times = metrics.stage_times
+        output_writer.stage_times = metrics.stage_times
+    profiler = None
+    if args.profile_file:
+        import cProfile # pylint: disable=import-outside-toplevel
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    input_row_count = resume_state['input_row_count'] if resume_state else 0
+    output_row_count = resume_state['output_row_count'] if resume_state else 0
+    if args.workers > 1:
+        input_row_count, output_row_count = map_parallel(input_rows,
+                                                         output_writer,
+                                                         spire_mapper_instance,
+                                                         args.workers,
+                                                         args.chunk_size,
+                                                         ordered_output=not args.unordered_output,
+                                                         stats_seed=args.stats_seed,
+                                                         delta=delta,
+                                                         header=header,
+                                                         json_library=record_encoding,
+                                                         metrics=metrics,
+                                                         checkpoint=checkpoint,
+                                                         input_row_count=input_row_count,
+                                                         output_row_count=output_row_count,
+                                                         record_batches=record_batches)
+    else:
+        next_progress = (input_row_count // 1000 + 1) * 1000
+        for input_row in input_rows:
+            input_row_num = input_row_count + 1
+            input_row_count += len(input_row) if record_batches else 1
+
+            if metrics:
+                start_time = time.perf_counter()
+                json_list = map_function(input_row, input_row_num)
+                metrics.stage_times['map'] += time.perf_counter() - start_time
+            else:
+                json_list = map_function(input_row, input_row_num)
+            for json_data in json_list:
+                if delta and delta.check(json_data['RECORD_ID'], json_data['RECORD_TYPE'], spire_mapper_instance.compute_record_hash(json_data)) == 'UNCHANGED':
+                    continue
+                output_writer.write(json_data)
+                output_row_count += 1
+
+            if input_row_count >= next_progress:
+                print('%s rows processed, %s rows written' % (input_row_count, output_row_count))
+                next_progress = (input_row_count // 1000 + 1) * 1000
+                if metrics:
+                    metrics.report_if_due(input_row_count, output_row_count)
+            if checkpoint and checkpoint.is_due(input_row_count):
+                checkpoint.save(checkpoint.input_reader.offset, input_row_count, output_row_count, spire_mapper_instance)
+            if shut_down:
+                break
+
+    #--an interrupted run saves where it stopped, a completed one no longer needs its checkpoint
+    if checkpoint:
         if shut_down:
-            break
+            checkpoint.save(checkpoint.input_reader.offset, input_row_count, output_row_count, spire_mapper_instance)
+            print('Checkpoint saved to %s, add --resume to continue\n' % args.checkpoint_file)
+        else:
+            checkpoint.remove()
+
+    #--an aborted run has not seen every record, so it must not delete anything or replace the state
+    if delta:
+        if not shut_down:
+            for json_data in delta.finish('SPIRE'):
+                output_writer.write(json_data)
+                output_row_count += 1
+        else:
+            delta.close()
+
+    output_writer.close()
+    if args.pipeline:
+        output_writer = output_writer.writer
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(args.profile_file)
+    if metrics:
+        metrics.report(input_row_count, output_row_count, True)
 
     elapsed_mins = round((time.time() - proc_start_time) / 60, 1)
     run_status = ('completed in' if not shut_down else 'aborted after') + ' %s minutes' % elapsed_mins
     print('%s rows processed, %s rows written, %s\n' % (input_row_count, output_row_count, run_status))
-
-    output_file_handle.close()
-    input_file_handle.close()
+    if input_filter:
+        print('%s rows filtered out\n' % sum(spire_mapper_instance.stat_pack.get_count('!FILTERED', column) for column in input_filter.columns))
+    if spire_mapper_instance.dedupe_owners:
+        suppressed_count = spire_mapper_instance.stat_pack.get_count('!INFO', 'DUPLICATE_OWNER_SUPPRESSED')
+        print('%s duplicate owner records suppressed\n' % suppressed_count)
+    if delta:
+        print('%(NEW)s new, %(CHANGED)s changed, %(UNCHANGED)s unchanged, %(DELETED)s deleted records\n' % delta.status_counts)
+
+    if args.shards > 1:
+        for shard_file_name, shard_count in zip(output_writer.file_names, output_writer.shard_counts):
+            print('%s records written to %s' % (shard_count, shard_file_name))
+        print()
+    if output_file_handle:
+        close_file(output_writer.file_handle, output_binary_handle)
+    elif args.load_to:
+        print('%s records loaded, %s retries, %s errors%s\n' % (output_writer.loaded_count,
+                                                               output_writer.retry_count,
+                                                               output_writer.error_count,
+                                                               (', failed records written to %s' % args.load_error_file) if output_writer.error_count else ''))
+    if input_file_handle:
+        close_file(input_file_handle, input_binary_handle)
 
     #--write statistics file
     if args.log_file:
+        spire_mapper_instance.capture_cache_stats()
         with open(args.log_file, 'w') as outfile:
-            json.dump(mapper.stat_pack, outfile, indent=4, sort_keys = True)
+            json.dump(spire_mapper_instance.stat_pack.report(), outfile, indent=4, sort_keys = True)
         print('Mapping stats written to %s\n' % args.log_file)
+    if args.part_stats_file:
+        if shut_down:
+            print('Part stats not written as the run was aborted\n')
+        else:
+            import pickle
+            spire_mapper_instance.capture_cache_stats()
+            with open(args.part_stats_file, 'wb') as part_stats_file:
+                pickle.dump(spire_mapper_instance.stat_pack, part_stats_file, protocol=pickle.HIGHEST_PROTOCOL)
+            print('Part stats written to %s\n' % args.part_stats_file)
+    if args.profile_file:
+        print('Profile written to %s, view it with python3 -m pstats %s\n' % (args.profile_file, args.profile_file))
 
     sys.exit(0)
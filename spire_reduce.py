@@ -0,0 +1,106 @@
+#! /usr/bin/env python3
+
+import sys
+import os
+import argparse
+import json
+import pickle
+import time
+
+import spire_mapper
+
+#=========================
+class part_stats_unpickler(pickle.Unpickler):
+    ''' the parts pickle their stats from spire_mapper run as __main__, so its classes are found there '''
+
+    #----------------------------------------
+    def find_class(self, module, name):
+        if module == '__main__':
+            module = 'spire_mapper'
+        return super().find_class(module, name)
+
+#----------------------------------------
+def load_part_stats(part_stats_file_names):
+    ''' merges the statistics the parts saved with --part_stats_file '''
+    stat_pack = None
+    for part_stats_file_name in part_stats_file_names:
+        with open(part_stats_file_name, 'rb') as part_stats_file:
+            part_stat_pack = part_stats_unpickler(part_stats_file).load()
+        if stat_pack is None:
+            stat_pack = part_stat_pack
+        else:
+            stat_pack.merge(part_stat_pack)
+    return stat_pack or spire_mapper.mapping_stats()
+
+#----------------------------------------
+def reduce_parts(part_file_names, output_writer, mapper):
+    ''' copies the part outputs in order, writing each owner organization only the first time it is seen '''
+    output_row_count = 0
+    for part_file_name in part_file_names:
+        input_file_handle, input_binary_handle = spire_mapper.open_input_file(part_file_name)
+        for line in input_file_handle:
+            line = line.rstrip('\n')
+            if not line.strip():
+                continue
+
+            #--only owner records need to be parsed, the vessels are copied as they are
+            if '"RECORD_TYPE":"ORGANIZATION"' in line or '"RECORD_TYPE": "ORGANIZATION"' in line:
+                json_data = json.loads(line)
+                if json_data.get('RECORD_TYPE') == 'ORGANIZATION':
+                    if not mapper.is_new_owner(json_data['RECORD_ID']):
+                        continue
+                    mapper.capture_mapped_stats(json_data)
+            output_writer.write_line(line)
+            output_row_count += 1
+        spire_mapper.close_file(input_file_handle, input_binary_handle)
+    return output_row_count
+
+#----------------------------------------
+if __name__ == "__main__":
+    proc_start_time = time.time()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--input_files', dest='input_files', nargs='+', required=True, help='the output files of the parts, in part order')
+    parser.add_argument('-s', '--part_stats_files', dest='part_stats_files', nargs='+', default=[], help='the --part_stats_file of each part')
+    parser.add_argument('-o', '--output_file', dest='output_file', required=True, help='the merged output file, compressed by extension (.gz, .bz2, .xz, .zst), - for stdout')
+    parser.add_argument('-l', '--log_file', dest='log_file', help='optional name of the merged statistics log file')
+    parser.add_argument('--all_owner_records', dest='all_owner_records', action='store_true', default=False, help='keep an owner record for every vessel, use it if the parts were mapped with --all_owner_records')
+    parser.add_argument('--json_library', dest='json_library', choices=['auto', 'orjson', 'ujson', 'json'], default='auto', help='json library used to write the output, auto uses orjson or ujson when installed')
+    args = parser.parse_args()
+
+    for file_name in args.input_files + args.part_stats_files:
+        if not os.path.exists(file_name):
+            print('\nFile %s not found\n' % file_name)
+            sys.exit(1)
+    if args.log_file and not args.part_stats_files:
+        print('\nPlease supply the --part_stats_files of the parts to write a log file\n')
+        sys.exit(1)
+
+    #--keep progress messages out of the records when writing to stdout
+    if args.output_file == '-':
+        sys.stdout = sys.stderr
+
+    mapper = spire_mapper.mapper(dedupe_owners=not args.all_owner_records)
+    mapper.capture_stats = bool(args.log_file)
+    mapper.stat_pack = load_part_stats(args.part_stats_files)
+    try:
+        output_file_handle, output_binary_handle = spire_mapper.open_output_file(args.output_file)
+    except ValueError as err:
+        print('\n%s\n' % err)
+        sys.exit(1)
+    output_writer = spire_mapper.record_writer(output_file_handle, args.json_library)
+    output_row_count = reduce_parts(args.input_files, output_writer, mapper)
+    output_writer.close()
+    spire_mapper.close_file(output_file_handle, output_binary_handle)
+
+    elapsed_mins = round((time.time() - proc_start_time) / 60, 1)
+    print('%s parts merged, %s rows written, completed in %s minutes\n' % (len(args.input_files), output_row_count, elapsed_mins))
+    if mapper.dedupe_owners:
+        print('%s duplicate owner records suppressed\n' % mapper.stat_pack.get_count('!INFO', 'DUPLICATE_OWNER_SUPPRESSED'))
+
+    if args.log_file:
+        with open(args.log_file, 'w') as outfile:
+            json.dump(mapper.stat_pack.report(), outfile, indent=4, sort_keys = True)
+        print('Mapping stats written to %s\n' % args.log_file)
+
+    sys.exit(0)